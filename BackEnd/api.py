@@ -1,12 +1,126 @@
-import sqlite3
+import math
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException
+import anyio
+from anyio import to_thread
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fetch_waste_bins import fetch_waste_bins
+from pydantic import BaseModel
+from bin_store import get_bin_store
+from bin_tiles import TILE_FORMATS, TILE_ZOOM, etag_matches, get_bin_tiles, merged_tile, tile_bbox
+from fetch_waste_bins import (
+    OVERPASS_URL, SEARCH_RADIUS_KM, SNAPSHOT_QUERY, fetch_snapshot_async, fetch_waste_bins, install_snapshot,
+)
+from regions import DEFAULT_REGION, get_region_index
+from responses import FastJSONResponse, bins_response, wants_columns
 from closest_bin import closest_bin
+from bin_refresher import BinRefresher
+from cache import LRUCache
+from singleflight import AsyncSingleFlight
+import db
+import metrics
+import migrations
+import votes
+# Co ile sekund odświeżać zrzut koszy w tle (brak = bez odświeżania)
+BIN_REFRESH_INTERVAL = os.environ.get("BIN_REFRESH_INTERVAL")
+
+# Gotowe odpowiedzi /product trzymane po kodzie kreskowym. Każdy zapis
+# zmieniający produkt musi wywołać product_cache.invalidate(barcode), a
+# wypełnienie cache przekazać generację sprzed zapytania (cache_product).
+product_cache = LRUCache(
+    maxsize=int(os.environ.get("PRODUCT_CACHE_SIZE", 10_000)),
+    ttl=float(os.environ.get("PRODUCT_CACHE_TTL", 300)),
+)
+
+def invalidate_products(barcodes):
+    for barcode in barcodes:
+        product_cache.invalidate(barcode)
+
+# Weryfikacje i propozycje kategorii zapisywane do bazy partiami; po zapisie
+# partii wpisy produktów w cache są unieważniane
+vote_queue = votes.VoteQueue(on_flush=invalidate_products)
+
+# Limit kodów w jednym POST /products/batch
+MAX_BATCH_SIZE = int(os.environ.get("PRODUCT_BATCH_SIZE", 1000))
+# Kodów w jednym WHERE barcode IN (...) - poniżej limitu parametrów starszych SQLite
+SQL_IN_CHUNK = 500
+# Najwięcej koszy w jednej odpowiedzi /closest_bin (parametr k)
+MAX_CLOSEST_BINS = int(os.environ.get("CLOSEST_BIN_MAX_K", 100))
+
+# Osobne limity dla każdego zasobu: wolne Overpass czy obliczenia na koszach
+# nie zajmą wątków, na które czekają zapytania o produkty.
+DB_CONCURRENCY = int(os.environ.get("DB_CONCURRENCY", 16))
+BINS_CONCURRENCY = int(os.environ.get("BINS_CONCURRENCY", 4))
+OVERPASS_CONCURRENCY = int(os.environ.get("OVERPASS_CONCURRENCY", 2))
+OVERPASS_TIMEOUT_S = float(os.environ.get("OVERPASS_TIMEOUT", 30))
+
+db_limiter = anyio.CapacityLimiter(DB_CONCURRENCY)
+bins_limiter = anyio.CapacityLimiter(BINS_CONCURRENCY)
+overpass_limiter = anyio.CapacityLimiter(OVERPASS_CONCURRENCY)
+
+# Kafelki koszy zmieniają się tylko przy nowym zrzucie - klient i CDN sprawdzają je po ETag
+TILE_MAX_AGE_S = int(os.environ.get("TILE_MAX_AGE", 300))
+
+# Łączenie identycznych równoległych wywołań: Overpass po zapytaniu, baza po kodzie
+overpass_flight = AsyncSingleFlight()
+product_flight = AsyncSingleFlight()
+
+# Wspólny klient HTTP (pula połączeń) - tworzony przy pierwszym zapytaniu do Overpass;
+# import httpx i przygotowanie kontekstu TLS trwają ~0.3 s, więc nie przy starcie
+http_client = None
+
 
-DB_FILE = "waste.db"
-app = FastAPI()
+class _HTTPErrorPlaceholder(Exception):
+    """ HTTPError, dopóki httpx nie jest zaimportowany - żaden jego wyjątek nie mógł jeszcze paść """
+
+
+# Wyjątki httpx łapane w handlerach; podmieniane na httpx.HTTPError przy tworzeniu klienta
+HTTPError = _HTTPErrorPlaceholder
+
+
+def get_http_client():
+    global http_client, HTTPError
+    if http_client is None:
+        import httpx
+
+        HTTPError = httpx.HTTPError
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OVERPASS_TIMEOUT_S, connect=5),
+            limits=httpx.Limits(max_connections=OVERPASS_CONCURRENCY * 2),
+        )
+    return http_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client
+    if db.pool.read_only:
+        # Gotowy obraz (build_image.py): bez migracji i bez zapisów
+        await run_db(lambda: migrations.require_latest(db.get_connection()))
+    else:
+        # Brakujące indeksy zakładane są przy starcie na istniejącej bazie
+        await run_db(lambda: migrations.migrate(db.get_connection()))
+        # Głosy z dziennika, które nie trafiły do bazy przed restartem
+        await run_db(vote_queue.start)
+    refresher = None
+    if BIN_REFRESH_INTERVAL:
+        refresher = BinRefresher(float(BIN_REFRESH_INTERVAL))
+        refresher.start()
+    yield
+    if refresher is not None:
+        refresher.stop(timeout=1)
+    await run_db(vote_queue.stop)
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+    db.pool.close_all()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,33 +129,247 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Czas każdego zapytania dla /metrics; dodany jako ostatni, więc obejmuje też CORS
+app.add_middleware(metrics.MetricsMiddleware)
+
+async def run_db(func, *args):
+    """ Wywołanie bazy w wątku z puli ograniczonej db_limiter """
+    return await to_thread.run_sync(func, *args, limiter=db_limiter)
+
+async def ensure_bin_store():
+    """
+    Indeks koszy. Gdy nie ma zrzutu na dysku, pobiera go z Overpass przez
+    wspólnego klienta HTTP - najwyżej OVERPASS_CONCURRENCY zapytań naraz
+    i nie dłużej niż OVERPASS_TIMEOUT_S razem z czekaniem w kolejce.
+    """
+    try:
+        return await to_thread.run_sync(get_bin_store, limiter=bins_limiter)
+    except (OSError, ValueError):
+        pass
+
+    # Zapytanie do Overpass nie zależy od pozycji użytkownika - równoległe
+    # /bins czekają na jedno pobranie zamiast wysyłać własne
+    try:
+        with anyio.fail_after(OVERPASS_TIMEOUT_S):
+            return await overpass_flight.do((OVERPASS_URL, SNAPSHOT_QUERY), download_bin_store)
+    except TimeoutError:
+        metrics.upstream_errors.inc("overpass", "timeout")
+        raise
+
+async def download_bin_store():
+    try:
+        async with overpass_limiter:
+            data = await fetch_snapshot_async(get_http_client(), OVERPASS_URL)
+    except (HTTPError, ValueError) as e:
+        # Liczone raz na pobranie, nie dla każdego połączonego czekającego
+        metrics.upstream_errors.inc("overpass", type(e).__name__)
+        raise
+    return await to_thread.run_sync(install_snapshot, data, limiter=bins_limiter)
+
+async def ensure_default_region(regions):
+    """
+    Tylko zrzut domyślnego regionu może zostać pobrany z Overpass w trakcie
+    zapytania; pozostałe regiony wczytywane są z dysku przez RegionIndex.
+    """
+    if DEFAULT_REGION in regions:
+        await ensure_bin_store()
 
 @app.get("/bins")
-def get_bins(lat: float, long: float, category: str):
-    bins = fetch_waste_bins(lat, long, category)
-    return bins
+async def get_bins(lat: float, long: float, category: str, request: Request):
+    """
+    Kosze w promieniu SEARCH_RADIUS_KM jako lista [lat, lon, typ, odległość];
+    z nagłówkiem Accept: application/vnd.bins-columns+json jako słownik kolumn.
+    """
+    columns = wants_columns(request)
+    regions = [name for _, name in get_region_index().regions_near(lat, long, SEARCH_RADIUS_KM)]
+    try:
+        await ensure_default_region(regions)
+    except (HTTPError, TimeoutError, ValueError):
+        return {"error": "Failed to fetch data"}
+    bins = await to_thread.run_sync(fetch_waste_bins, lat, long, category, columns, limiter=bins_limiter)
+    return bins_response(bins, columns)
+
+@app.get("/bins/tiles/{z}/{x}/{y}")
+async def get_bin_tile(z: int, x: int, y: int, request: Request, category: str = None, format: str = "json"):
+    """
+    Kosze w kafelku slippy map (z/x/y) jako gotowa, skompresowana odpowiedź
+    z ETagiem. Odległość do użytkownika liczy klient.
+    """
+    if z != TILE_ZOOM:
+        raise HTTPException(status_code=404, detail=f"Only zoom {TILE_ZOOM} tiles are available")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+    if format not in TILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(TILE_FORMATS)}")
+    index = get_region_index()
+    regions = index.regions_in_bbox(tile_bbox(x, y, z))
+    try:
+        await ensure_default_region(regions)
+    except (HTTPError, TimeoutError, ValueError):
+        raise HTTPException(status_code=503, detail="Failed to fetch data")
+    if all(index.is_loaded(name) for name in regions):
+        stores = index.stores(regions)
+    else:
+        stores = await to_thread.run_sync(index.stores, regions, limiter=bins_limiter)
+    if regions and not stores:
+        raise HTTPException(status_code=503, detail="Failed to fetch data")
+
+    if len(stores) == 1:
+        tiles = get_bin_tiles(stores[0])
+        if tiles.is_built(category, format):
+            tile = tiles.tile(category, x, y, format)
+        else:
+            tile = await to_thread.run_sync(tiles.tile, category, x, y, format, limiter=bins_limiter)
+    else:
+        # Kafelek na granicy regionów (albo poza nimi - wtedy pusty)
+        tiles = [get_bin_tiles(store) for store in stores]
+        tile = await to_thread.run_sync(merged_tile, tiles, category, x, y, format, limiter=bins_limiter)
+
+    use_gzip = "gzip" in request.headers.get("accept-encoding", "")
+    etag = tile.gzip_etag if use_gzip else tile.etag
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={TILE_MAX_AGE_S}", "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(tile.gzip_body, media_type="application/json", headers=headers)
+    return Response(tile.body, media_type="application/json", headers=headers)
 
 @app.get("/closest_bin")
-def get_closest_bin(x: float, y: float, type_: str = None):
-    closest = closest_bin(x, y, type_)
-    return closest
+async def get_closest_bin(
+    request: Request, x: float, y: float, type_: str = None,
+    k: int = Query(1, ge=1, le=MAX_CLOSEST_BINS), max_distance: float = Query(None, gt=0),
+):
+    columns = wants_columns(request)
+    radius = max_distance if max_distance is not None else math.inf
+    regions = [name for _, name in get_region_index().regions_near(x, y, radius)]
+    try:
+        # Bez limitu odległości pobieranie z Overpass ma sens tylko, gdy domyślny region jest najbliższy
+        await ensure_default_region(regions if max_distance is not None else regions[:1])
+    except (HTTPError, TimeoutError, ValueError):
+        return {"error": "Failed to fetch data"}
+    closest = await to_thread.run_sync(closest_bin, x, y, type_, k, max_distance, columns, limiter=bins_limiter)
+    return bins_response(closest, columns)
 
 
-@app.get("/product/{barcode}")
-def get_product(barcode: str):
-    """ Pobiera produkt po kodzie kreskowym lub tworzy nowy wpis """
-    product = get_or_create_product(barcode)
+async def cached_product(barcode: str):
+    """ Produkt z cache albo z bazy (tworzony, gdy go nie ma - poza obrazem tylko do odczytu); bez oczekujących głosów """
+    # Trafienie w cache obsługujemy bez przełączania na wątek
+    product = product_cache.get(barcode)
+    if product is None:
+        # Równoległe skany tego samego kodu dzielą jedno zapytanie do bazy
+        product = await product_flight.do(barcode, lambda: run_db(load_or_create_product, barcode))
     if not product:
+        if db.pool.read_only:
+            raise HTTPException(status_code=404, detail="Product not found")
         raise HTTPException(status_code=500, detail="Error creating product")
-
     return product
 
-def get_or_create_product(barcode: str):
-    """ Pobiera produkt z bazy lub tworzy nowy wpis """
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+def require_writable():
+    """ Replika z obrazem bazy (DB_IMAGE) nie przyjmuje zapisów """
+    if db.pool.read_only:
+        raise HTTPException(status_code=503, detail="Read-only replica")
+
+@app.get("/product/{barcode}")
+async def get_product(barcode: str):
+    """ Pobiera produkt po kodzie kreskowym lub tworzy nowy wpis """
+    product = await cached_product(barcode)
+    return FastJSONResponse(vote_queue.apply(product))
+
+@app.post("/product/{barcode}/verify")
+async def verify_product(barcode: str):
+    """ Głos potwierdzający dane produktu; liczba weryfikacji rośnie od razu w odpowiedziach """
+    require_writable()
+    product = await cached_product(barcode)
+    if not vote_queue.started:
+        await run_db(vote_queue.start)
+    vote_queue.verify(barcode)
+    return FastJSONResponse(vote_queue.apply(product), status_code=202)
+
+class CategorySuggestion(BaseModel):
+    category: str
+
+@app.post("/product/{barcode}/category")
+async def suggest_category(barcode: str, suggestion: CategorySuggestion):
+    """
+    Propozycja kategorii recyklingu. Produkt bez kategorii dostaje tę z
+    największą liczbą głosów (co najmniej CATEGORY_MIN_VOTES).
+    """
+    if suggestion.category not in votes.RECYCLE_CATEGORIES:
+        raise HTTPException(
+            status_code=400, detail=f"category must be one of {', '.join(votes.RECYCLE_CATEGORIES)}"
+        )
+    require_writable()
+    product = await cached_product(barcode)
+    if not vote_queue.started:
+        await run_db(vote_queue.start)
+    vote_queue.suggest_category(barcode, suggestion.category)
+    return FastJSONResponse(vote_queue.apply(product), status_code=202)
+
+class BatchRequest(BaseModel):
+    barcodes: List[str]
+
+@app.post("/products/batch")
+async def get_products_batch(request: BatchRequest):
+    """ Pobiera wiele produktów naraz; wynik w kolejności kodów z zapytania """
+    if len(request.barcodes) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} barcodes per request")
+
+    products = await run_db(get_or_create_products, request.barcodes)
+    return FastJSONResponse([vote_queue.apply(product) for product in products])
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """ Statystyki cache produktów (trafienia, chybienia, usunięcia) """
+    return {"product": product_cache.stats()}
+
+@app.get("/coalescing/stats")
+async def get_coalescing_stats():
+    """ Ile wywołań dołączyło do trwającego już pobrania zamiast wykonać własne """
+    return {"overpass": overpass_flight.stats(), "product": product_flight.stats()}
 
-    cursor.execute('''
+def component_stats():
+    """ Liczbowe statystyki cache, łączenia wywołań, kolejki głosów i regionów koszy dla /metrics """
+    index = get_region_index()
+    sources = {
+        "product_cache": product_cache.stats(),
+        "overpass_flight": overpass_flight.stats(),
+        "product_flight": product_flight.stats(),
+        "votes": vote_queue.stats(),
+        "bin_regions": {"loads": index.loads, "evictions": index.evictions, "loaded": len(index.loaded_regions())},
+    }
+    for component, stats in sources.items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)):
+                yield (component, stat), value
+
+metrics.registry.gauge_func(
+    "component_stats", "Statystyki cache, łączenia wywołań, kolejki głosów i regionów koszy", ("component", "stat"), component_stats
+)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """ Histogramy czasu zapytań i etapów, błędy zewnętrznych serwisów, statystyki cache (format Prometheus) """
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@dataclass(slots=True, frozen=True)
+class Product:
+    """
+    Odpowiedź API dla produktu. Pola w kolejności kolumn PRODUCT_SELECT,
+    więc wiersz z bazy zamienia się przez Product(*row). Niezmienny - ten
+    sam obiekt bezpiecznie siedzi w product_cache.
+    """
+    id: int
+    name: Optional[str]
+    recycle_type: Optional[str]
+    product_type: Optional[str]
+    barcode: str
+    green_score: Optional[str]
+    carbon_footprint: Optional[float]
+    number_of_verifications: int
+    image_url: Optional[str]
+
+PRODUCT_SELECT = '''
     SELECT 
         P.id,
         P.name,
@@ -55,78 +383,138 @@ def get_or_create_product(barcode: str):
     FROM Product P
     LEFT JOIN Types T ON P.type_id = T.type_id
     LEFT JOIN Types_recycle TR ON P.type_recycle_id = TR.type_recycle_id
-    WHERE P.barcode = ?
-    ''', (barcode,))
+'''
 
-    result = cursor.fetchone()
+WASTE_TYPE_SELECT = '''
+    SELECT T.type_name FROM Product P
+    JOIN Types T ON P.type_id = T.type_id
+    WHERE P.id = ?
+'''
+
+def find_product(cursor, barcode: str):
+    with metrics.span("product_select"):
+        cursor.execute(PRODUCT_SELECT + "WHERE P.barcode = ?", (barcode,))
+
+        return cursor.fetchone()
 
+def find_products(cursor, barcodes):
+    """ Wiersze produktów dla wielu kodów, po SQL_IN_CHUNK kodów w jednym zapytaniu """
+    rows = {}
+    for i in range(0, len(barcodes), SQL_IN_CHUNK):
+        chunk = barcodes[i:i + SQL_IN_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        with metrics.span("products_select"):
+            cursor.execute(PRODUCT_SELECT + f"WHERE P.barcode IN ({placeholders})", chunk)
+            rows.update((row[4], row) for row in cursor.fetchall())
+    return rows
+
+def get_or_create_product(barcode: str):
+    """ Pobiera produkt z bazy lub tworzy nowy wpis """
+    product = product_cache.get(barcode)
+    if product is not None:
+        return product
+
+    return load_or_create_product(barcode)
+
+def load_or_create_product(barcode: str):
+    """ Część get_or_create_product sięgająca do bazy (bez sprawdzania cache) """
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    # Generacja cache sprzed zapytania - wiersz przeczytany przed zapisem
+    # głosów, który w międzyczasie unieważnił cache, nie zostanie zapamiętany
+    generation = product_cache.generation
+    result = find_product(cursor, barcode)
     if result:
-        conn.close()
-        return {
-            "id": result[0],
-            "name": result[1],
-            "recycle_type": result[2],
-            "product_type": result[3],
-            "barcode": result[4],
-            "green_score": result[5],
-            "carbon_footprint": result[6],
-            "number_of_verifications": result[7],
-            "image_url": result[8]
-        }
-
-    cursor.execute('''
-    INSERT INTO Product (name, type_recycle_id, type_id, barcode, green_score, carbon_footprint, number_of_verifications, image_url)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', ("Unknown Product", None, None, barcode, None, None, 0, None))
-
-    conn.commit()
-
-    new_id = cursor.lastrowid
-    cursor.execute('''
-    SELECT 
-        P.id,
-        P.name,
-        TR.type_name,
-        T.type_name,
-        P.barcode,
-        P.green_score,
-        P.carbon_footprint,
-        P.number_of_verifications,
-        P.image_url
-    FROM Product P
-    LEFT JOIN Types T ON P.type_id = T.type_id
-    LEFT JOIN Types_recycle TR ON P.type_recycle_id = TR.type_recycle_id
-    WHERE P.id = ?
-    ''', (new_id,))
-
-    new_product = cursor.fetchone()
-    conn.close()
-
-    return {
-        "id": new_product[0],
-        "name": new_product[1],
-        "recycle_type": new_product[2],
-        "product_type": new_product[3],
-        "barcode": new_product[4],
-        "green_score": new_product[5],
-        "carbon_footprint": new_product[6],
-        "number_of_verifications": new_product[7],
-        "image_url": new_product[8]
-    }
+        return cache_product(cursor, barcode, Product(*result), generation)
+    if db.pool.read_only:
+        return None
+
+    # Nowy wpis nie ma jeszcze typów, więc nazwy typów to NULL - bez drugiego JOIN-a.
+    # Przy równoległym tworzeniu tego samego kodu wygrywa jeden INSERT, reszta
+    # dostaje pusty RETURNING i czyta wiersz zwycięzcy.
+    with metrics.span("product_insert"):
+        cursor.execute('''
+        INSERT INTO Product (name, type_recycle_id, type_id, barcode, green_score, carbon_footprint, number_of_verifications, image_url)
+        VALUES (?, NULL, NULL, ?, NULL, NULL, 0, NULL)
+        ON CONFLICT(barcode) DO NOTHING
+        RETURNING id, name, NULL, NULL, barcode, green_score, carbon_footprint, number_of_verifications, image_url
+        ''', ("Unknown Product", barcode))
+
+        new_product = cursor.fetchone()
+        conn.commit()
+
+    if new_product is None:
+        new_product = find_product(cursor, barcode)
+    if new_product is None:
+        return None
+
+    return cache_product(cursor, barcode, Product(*new_product), generation)
+
+def cache_product(cursor, barcode: str, product: Product, generation: int):
+    """
+    Zapisuje produkt w cache. Gdy od odczytu generacji cache coś unieważniono
+    (np. zapis partii głosów), wiersz mógł być sprzed zmiany, a głosy zeszły
+    już z nakładki VoteQueue - wtedy produkt jest czytany ponownie z bazy.
+    """
+    if product_cache.put(barcode, product, generation):
+        return product
+    result = find_product(cursor, barcode)
+    return Product(*result) if result else None
+
+def get_or_create_products(barcodes: List[str]):
+    """
+    Wersja get_or_create_product dla wielu kodów: brakujące w cache kody
+    czytane są zapytaniami WHERE barcode IN (...), a nieznane produkty
+    zakładane w jednej transakcji. Wynik w kolejności barcodes.
+    """
+    products = {}
+    misses = []
+    for barcode in dict.fromkeys(barcodes):
+        product = product_cache.get(barcode)
+        if product is not None:
+            products[barcode] = product
+        else:
+            misses.append(barcode)
+
+    if misses:
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        generation = product_cache.generation
+        rows = find_products(cursor, misses)
+
+        missing = [barcode for barcode in misses if barcode not in rows]
+        if missing and not db.pool.read_only:
+            with metrics.span("products_insert"):
+                cursor.executemany('''
+                INSERT INTO Product (name, type_recycle_id, type_id, barcode, green_score, carbon_footprint, number_of_verifications, image_url)
+                VALUES (?, NULL, NULL, ?, NULL, NULL, 0, NULL)
+                ON CONFLICT(barcode) DO NOTHING
+                ''', [("Unknown Product", barcode) for barcode in missing])
+                conn.commit()
+            rows.update(find_products(cursor, missing))
+
+        stale = []
+        for barcode, row in rows.items():
+            product = Product(*row)
+            if not product_cache.put(barcode, product, generation):
+                stale.append(barcode)
+            products[barcode] = product
+        if stale:
+            # Cache unieważniony w trakcie zapytania (patrz cache_product) - ponowny odczyt bez zapisu w cache
+            for barcode, row in find_products(cursor, stale).items():
+                products[barcode] = Product(*row)
+
+    return [products.get(barcode) for barcode in barcodes]
 
 def get_waste_type(product_id: int):
     """ Pobiera typ odpadów dla danego produktu """
-    conn = sqlite3.connect(DB_FILE)
+    conn = db.get_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
-    SELECT T.type_name FROM Product P
-    JOIN Types T ON P.type_id = T.type_id
-    WHERE P.id = ?
-    ''', (product_id,))
+    cursor.execute(WASTE_TYPE_SELECT, (product_id,))
 
     result = cursor.fetchone()
-    conn.close()
 
     return {"type": result[0]} if result else None
 
@@ -0,0 +1,1295 @@
+"""
+Benchmarki ścieżek krytycznych backendu na syntetycznych danych (offline).
+
+    python benchmark.py closest_bin --bins 100000
+    python benchmark.py distance --bins 100000 --users 2000
+    python benchmark.py product --requests 5000 --concurrency 32
+    python benchmark.py mixed --requests 3000 --bins-concurrency 64
+    python benchmark.py herd --clients 200
+    python benchmark.py tiles --bins 20000
+    python benchmark.py serialization --bins 10000
+    python benchmark.py startup --bins 200000 --max-seconds 0.6
+    python benchmark.py regions --regions 36 --bins-per-region 5000
+    python benchmark.py product_batch --requests 5000 --batch-size 200
+    python benchmark.py votes --votes 20000 --threads 8
+    python benchmark.py scraper --barcodes 500 --latency 0.05 --concurrency 16
+    python benchmark.py dump --size-mb 2048
+    python benchmark.py suite --output baseline.json
+    python benchmark.py suite --baseline baseline.json --threshold 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import gzip
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from bin_store import BinStore, matches_type
+from cache import LRUCache
+from distance import coverage, haversine_distance, haversine_np
+
+KRAKOW_CENTER = (50.06143, 19.93658)
+BIN_CATEGORIES = ["glass", "paper", "plastic", "metal", "organic"]
+
+
+def synthetic_elements(n, seed=0, center=KRAKOW_CENTER, spread_deg=0.15):
+    """ Generuje n węzłów w formacie Overpass rozrzuconych wokół center """
+    rng = random.Random(seed)
+    elements = []
+    for i in range(n):
+        if rng.random() < 0.4:
+            tags = {"amenity": "waste_basket"}
+        else:
+            tags = {"amenity": "recycling", "recycling_type": "container"}
+            for category in rng.sample(BIN_CATEGORIES, rng.randint(1, 2)):
+                tags[f"recycling:{category}"] = "yes"
+        elements.append({
+            "type": "node",
+            "id": i,
+            "lat": center[0] + rng.uniform(-spread_deg, spread_deg),
+            "lon": center[1] + rng.uniform(-spread_deg, spread_deg) * 1.5,
+            "tags": tags,
+        })
+    return elements
+
+
+def random_points(n, seed=1, center=KRAKOW_CENTER, spread_deg=0.15):
+    rng = random.Random(seed)
+    return [
+        (center[0] + rng.uniform(-spread_deg, spread_deg), center[1] + rng.uniform(-spread_deg, spread_deg) * 1.5)
+        for _ in range(n)
+    ]
+
+
+def time_per_call(fn, calls):
+    """ Średni czas jednego wywołania fn(*args) w sekundach """
+    start = time.perf_counter()
+    for args in calls:
+        fn(*args)
+    return (time.perf_counter() - start) / len(calls)
+
+
+def bench_closest_bin(args):
+    elements = synthetic_elements(args.bins)
+    start = time.perf_counter()
+    store = BinStore(elements)
+    print(f"Budowa indeksu dla {len(store)} koszy: {time.perf_counter() - start:.2f} s")
+
+    rng = random.Random(2)
+    calls = [(lat, lon, rng.choice(BIN_CATEGORIES)) for lat, lon in random_points(args.queries)]
+
+    def brute_force(lat, lon, type_filter):
+        # Dotychczasowa ścieżka: pełny skan i odległość euklidesowa na stopniach
+        bins = [[e["lat"], e["lon"]] for e in elements if matches_type(e["tags"], type_filter)]
+        return min(bins, key=lambda b: math.sqrt((lat - b[0]) ** 2 + (lon - b[1]) ** 2), default=None)
+
+    brute_calls = calls[:max(1, args.queries // 100)]
+    brute = time_per_call(brute_force, brute_calls)
+    indexed = time_per_call(lambda lat, lon, t: store.nearest(lat, lon, k=args.k, type_filter=t), calls)
+    print(f"Pełny skan:        {brute * 1e3:10.3f} ms/zapytanie")
+    print(f"Indeks (k={args.k}):     {indexed * 1e3:10.3f} ms/zapytanie  (x{brute / indexed:.0f})")
+
+
+def bench_distance(args):
+    elements = synthetic_elements(args.bins)
+    bin_lats = np.array([e["lat"] for e in elements])
+    bin_lons = np.array([e["lon"] for e in elements])
+    lat, lon = KRAKOW_CENTER
+
+    users = random_points(args.users)
+    user_lats = np.array([p[0] for p in users])
+    user_lons = np.array([p[1] for p in users])
+
+    start = time.perf_counter()
+    within = [d for d in (haversine_distance(lat, lon, b_lat, b_lon) for b_lat, b_lon in zip(bin_lats.tolist(), bin_lons.tolist())) if d <= 1]
+    scalar_time = time.perf_counter() - start
+    start = time.perf_counter()
+    distances = haversine_np(lat, lon, bin_lats, bin_lons)
+    within_np = distances[distances <= 1]
+    vector_time = time.perf_counter() - start
+    print(f"1 x {args.bins} skalarnie: {scalar_time * 1e3:9.2f} ms  ({len(within)} koszy w promieniu 1 km)")
+    print(f"1 x {args.bins} NumPy:     {vector_time * 1e3:9.2f} ms  ({len(within_np)} koszy, x{scalar_time / vector_time:.0f})")
+
+    start = time.perf_counter()
+    coverage(user_lats, user_lons, bin_lats, bin_lons)
+    print(f"Mapa pokrycia {args.users} x {args.bins} (macierz):  {time.perf_counter() - start:.2f} s")
+    store = BinStore(elements)
+    start = time.perf_counter()
+    store.coverage(user_lats, user_lons)
+    print(f"Mapa pokrycia {args.users} x {args.bins} (BinStore): {time.perf_counter() - start:.2f} s")
+
+
+def db_barcodes(db_file):
+    conn = sqlite3.connect(db_file)
+    barcodes = [row[0] for row in conn.execute("SELECT barcode FROM Product WHERE barcode IS NOT NULL")]
+    conn.close()
+    return barcodes
+
+
+async def http_load(app, paths, concurrency):
+    """ Prosty klient asyncio: concurrency pętli wysyła zapytania GET, zwraca zapytania/s """
+    import httpx
+
+    queue = list(paths)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            while queue:
+                response = await client.get(queue.pop())
+                assert response.status_code == 200, response.text
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return len(paths) / (time.perf_counter() - start)
+
+
+def bench_product(args):
+    import api
+    import db
+
+    barcodes = db_barcodes(db.DB_FILE)
+    rng = random.Random(3)
+    paths = [f"/product/{rng.choice(barcodes)}" for _ in range(args.requests)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Każdy wariant dostaje własną kopię bazy, żeby WAL z jednego nie pomagał drugiemu
+        baseline_db = shutil.copy(db.DB_FILE, os.path.join(tmp, "baseline.db"))
+        pooled_db = shutil.copy(db.DB_FILE, os.path.join(tmp, "pooled.db"))
+
+        # Porównanie warstwy bazy - bez cache produktów
+        product_cache = api.product_cache
+        api.product_cache = LRUCache(maxsize=0)
+
+        # Dotychczasowa ścieżka: nowe połączenie przy każdym zapytaniu
+        get_connection = db.get_connection
+        db.get_connection = lambda: sqlite3.connect(baseline_db)
+        try:
+            baseline = asyncio.run(http_load(api.app, paths, args.concurrency))
+        finally:
+            db.get_connection = get_connection
+
+        db.pool = db.ConnectionPool(pooled_db)
+        try:
+            pooled = asyncio.run(http_load(api.app, paths, args.concurrency))
+            api.product_cache = LRUCache(maxsize=product_cache.maxsize, ttl=product_cache.ttl)
+            cached = asyncio.run(http_load(api.app, paths, args.concurrency))
+            cache_stats = api.product_cache.stats()
+        finally:
+            db.pool.close_all()
+            api.product_cache = product_cache
+
+    print(f"/product, połączenie na zapytanie: {baseline:8.0f} zapytań/s")
+    print(f"/product, pula połączeń:          {pooled:8.0f} zapytań/s  (x{pooled / baseline:.2f})")
+    print(f"/product, pula + cache:           {cached:8.0f} zapytań/s  (x{cached / baseline:.2f})")
+    print(f"cache: {cache_stats}")
+
+
+def bench_product_batch(args):
+    """ GET /product/{barcode} po jednym vs POST /products/batch, bez cache produktów """
+    import httpx
+
+    import api
+    import db
+
+    barcodes = db_barcodes(db.DB_FILE)
+    rng = random.Random(6)
+    sample = [rng.choice(barcodes) for _ in range(args.requests)]
+    batches = [sample[i:i + args.batch_size] for i in range(0, len(sample), args.batch_size)]
+
+    async def run_batches(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            for batch in batches:
+                response = await client.post("/products/batch", json={"barcodes": batch})
+                assert response.status_code == 200, response.text
+                assert [product["barcode"] for product in response.json()] == batch
+            return len(sample) / (time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.pool = db.ConnectionPool(shutil.copy(db.DB_FILE, os.path.join(tmp, "batch.db")))
+        product_cache = api.product_cache
+        api.product_cache = LRUCache(maxsize=0)
+        try:
+            single = asyncio.run(http_load(api.app, [f"/product/{barcode}" for barcode in sample], 1))
+            batched = asyncio.run(run_batches(api.app))
+        finally:
+            db.pool.close_all()
+            api.product_cache = product_cache
+
+    print(f"GET /product po jednym:       {single:8.0f} produktów/s")
+    print(f"POST /products/batch ({args.batch_size:4d}): {batched:8.0f} produktów/s  (x{batched / single:.1f})")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def bench_mixed(args):
+    """
+    Opóźnienia GET /product samodzielnie i przy równoległym zalewie /bins,
+    gdy Overpass odpowiada po --overpass-latency s błędem 504 (każde /bins idzie do Overpass).
+    """
+    import httpx
+
+    import api
+    import bin_store
+    import db
+
+    def slow_overpass(path):
+        time.sleep(args.overpass_latency)
+        return 504, {"remark": "timeout"}
+
+    barcodes = db_barcodes(db.DB_FILE)
+    rng = random.Random(7)
+    paths = [f"/product/{rng.choice(barcodes)}" for _ in range(args.requests)]
+
+    async def product_latencies(client):
+        latencies = []
+        queue = list(paths)
+
+        async def worker():
+            while queue:
+                path = queue.pop()
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        return latencies
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            alone = await product_latencies(client)
+
+            done = asyncio.Event()
+            bins_served = 0
+
+            async def bins_flood():
+                nonlocal bins_served
+                while not done.is_set():
+                    await client.get("/bins", params={"lat": 50.06, "long": 19.93, "category": "glass"})
+                    bins_served += 1
+
+            flood = [asyncio.create_task(bins_flood()) for _ in range(args.bins_concurrency)]
+            await asyncio.sleep(0.1)
+            loaded = await product_latencies(client)
+            done.set()
+            await asyncio.gather(*flood)
+        await api.http_client.aclose()
+        api.http_client = None
+        return alone, loaded, bins_served
+
+    cwd = os.getcwd()
+    overpass_url = api.OVERPASS_URL
+    product_cache = api.product_cache
+    with local_http_server(slow_overpass) as url, tempfile.TemporaryDirectory() as tmp:
+        db.pool = db.ConnectionPool(shutil.copy(db.DB_FILE, os.path.join(tmp, "mixed.db")))
+        # Bez zrzutu koszy w katalogu roboczym i bez cache produktów
+        os.chdir(tmp)
+        bin_store.set_bin_store(None)
+        api.OVERPASS_URL = url
+        api.product_cache = LRUCache(maxsize=0)
+        try:
+            alone, loaded, bins_served = asyncio.run(run())
+        finally:
+            os.chdir(cwd)
+            api.OVERPASS_URL = overpass_url
+            api.product_cache = product_cache
+            db.pool.close_all()
+
+    for label, latencies in (("samo /product:   ", alone), ("/product + /bins:", loaded)):
+        print(
+            f"{label} p50 {percentile(latencies, 0.5) * 1000:7.2f} ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms"
+        )
+    print(f"/bins w tym czasie: {bins_served} odpowiedzi (Overpass {args.overpass_latency} s, 504)")
+
+
+def bench_herd(args):
+    """
+    Wiele równoległych /bins bez zrzutu koszy i wiele równoległych skanów
+    nowego kodu: ile zapytań dotarło do Overpass i do bazy.
+    """
+    import httpx
+
+    import api
+    import bin_store
+    import db
+
+    overpass_hits = 0
+    lock = threading.Lock()
+
+    def overpass(path):
+        nonlocal overpass_hits
+        with lock:
+            overpass_hits += 1
+        time.sleep(args.overpass_latency)
+        return 200, {"elements": synthetic_elements(1000)}
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            bins = await asyncio.gather(*(
+                client.get("/bins", params={"lat": 50.06, "long": 19.93, "category": "glass"})
+                for _ in range(args.clients)
+            ))
+            products = await asyncio.gather(*(client.get("/product/herd-new") for _ in range(args.clients)))
+            stats = (await client.get("/coalescing/stats")).json()
+        await api.http_client.aclose()
+        api.http_client = None
+        return bins, products, stats
+
+    cwd = os.getcwd()
+    overpass_url = api.OVERPASS_URL
+    with local_http_server(overpass) as url, tempfile.TemporaryDirectory() as tmp:
+        db.pool = db.ConnectionPool(shutil.copy(db.DB_FILE, os.path.join(tmp, "herd.db")))
+        os.chdir(tmp)
+        bin_store.set_bin_store(None)
+        api.OVERPASS_URL = url
+        api.product_cache.clear()
+        try:
+            bins, products, stats = asyncio.run(run())
+            rows = db.get_connection().execute("SELECT COUNT(*) FROM Product WHERE barcode = 'herd-new'").fetchone()[0]
+        finally:
+            os.chdir(cwd)
+            api.OVERPASS_URL = overpass_url
+            bin_store.set_bin_store(None)
+            db.pool.close_all()
+
+    assert all(response.status_code == 200 and isinstance(response.json(), list) for response in bins)
+    assert len({response.json()["id"] for response in products}) == 1 and rows == 1
+    print(f"{args.clients} równoległych /bins -> {overpass_hits} zapytań do Overpass, {stats['overpass']}")
+    print(f"{args.clients} równoległych skanów nowego kodu -> 1 wiersz, {stats['product']}")
+
+
+def bench_tiles(args):
+    """ /bins liczone dla każdego widoku vs gotowe kafelki z ETag (json, delta, gzip, 304) """
+    import httpx
+
+    import api
+    import bin_store
+    from bin_tiles import tile_xy
+    from regions import DEFAULT_REGION, get_region_index
+
+    store = BinStore(synthetic_elements(args.bins))
+    get_region_index().set_store(DEFAULT_REGION, store)
+    points = random_points(args.requests)
+    xs, ys = tile_xy([lat for lat, _ in points], [lon for _, lon in points])
+    tiles = [(x, y) for x, y in zip(xs.tolist(), ys.tolist())]
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            results = {}
+
+            sizes = []
+            start = time.perf_counter()
+            for lat, lon in points:
+                response = await client.get("/bins", params={"lat": lat, "long": lon, "category": "glass"})
+                sizes.append(len(response.content))
+            results["/bins"] = (len(points) / (time.perf_counter() - start), sum(sizes) / len(sizes))
+
+            for fmt, encoding in (("json", "identity"), ("json", "gzip"), ("delta", "gzip")):
+                headers = {"Accept-Encoding": encoding}
+                params = {"category": "glass", "format": fmt}
+                await client.get(f"/bins/tiles/15/{tiles[0][0]}/{tiles[0][1]}", params=params, headers=headers)
+                sizes = []
+                start = time.perf_counter()
+                for x, y in tiles:
+                    response = await client.get(f"/bins/tiles/15/{x}/{y}", params=params, headers=headers)
+                    # Rozmiar na łączu, przed rozpakowaniem
+                    sizes.append(int(response.headers["content-length"]))
+                label = f"kafelek {fmt}, {encoding}"
+                results[label] = (len(tiles) / (time.perf_counter() - start), sum(sizes) / len(sizes))
+
+            etags = {}
+            for x, y in tiles:
+                response = await client.get(f"/bins/tiles/15/{x}/{y}", params={"category": "glass"})
+                etags[(x, y)] = response.headers["etag"]
+            start = time.perf_counter()
+            for x, y in tiles:
+                response = await client.get(
+                    f"/bins/tiles/15/{x}/{y}", params={"category": "glass"}, headers={"If-None-Match": etags[(x, y)]}
+                )
+                assert response.status_code == 304
+            results["kafelek, 304"] = (len(tiles) / (time.perf_counter() - start), 0)
+            return results
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        bin_store.set_bin_store(None)
+
+    for label, (per_second, size) in results.items():
+        print(f"{label:24s} {per_second:8.0f} zapytań/s, {size:8.0f} B na odpowiedź")
+
+
+def bench_serialization(args):
+    """ Serializacja dużych odpowiedzi: jsonable_encoder + json (dawniej) vs orjson, wiersze vs kolumny """
+    import httpx
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    import api
+    import bin_store
+    from fetch_waste_bins import fetch_waste_bins
+    from regions import DEFAULT_REGION, get_region_index
+    from responses import BINS_COLUMNS_MEDIA_TYPE, FastJSONResponse
+
+    # Wszystkie kosze w promieniu 1 km od środka - jedna odpowiedź /bins ma ich args.bins
+    store = BinStore(synthetic_elements(args.bins, spread_deg=0.006))
+    get_region_index().set_store(DEFAULT_REGION, store)
+    lat, lon = KRAKOW_CENTER
+    try:
+        rows = fetch_waste_bins(lat, lon)
+        columns = fetch_waste_bins(lat, lon, columns=True)
+        assert len(rows) == len(columns["lat"]) == args.bins, len(rows)
+        # Ten sam wynik w obu formatach
+        decoded = json.loads(FastJSONResponse(columns).body)
+        assert [list(row) for row in zip(*decoded.values())] == rows
+
+        product_row = (1, "Produkt", "plastic", "bottle", "5900000000017", "b", 0.42, 3, "https://example.com/1.jpg")
+        product_dict = dict(zip(api.Product.__dataclass_fields__, product_row))
+        products = [api.Product(*product_row)] * args.payload_items
+
+        cases = {
+            f"/bins ({args.bins}): jsonable_encoder + json": lambda: JSONResponse(jsonable_encoder(rows)).body,
+            f"/bins ({args.bins}): orjson, wiersze": lambda: FastJSONResponse(rows).body,
+            f"/bins ({args.bins}): orjson, kolumny": lambda: FastJSONResponse(columns).body,
+            "/product: słownik + jsonable_encoder + json": lambda: JSONResponse(jsonable_encoder(product_dict)).body,
+            "/product: Product + orjson": lambda: FastJSONResponse(products[0]).body,
+            f"/products/batch ({args.payload_items}): słowniki + jsonable_encoder": lambda: JSONResponse(
+                jsonable_encoder([product_dict] * args.payload_items)
+            ).body,
+            f"/products/batch ({args.payload_items}): Product + orjson": lambda: FastJSONResponse(products).body,
+        }
+        for label, render in cases.items():
+            size = len(render())
+            per_call = time_per_call(render, [()] * args.repeats)
+            print(f"{label:52s} {per_call * 1e3:9.3f} ms, {size / 1024:8.1f} KiB")
+
+        async def run():
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                params = {"lat": lat, "long": lon, "category": "glass"}
+                for label, headers in (("wiersze", {}), ("kolumny", {"Accept": BINS_COLUMNS_MEDIA_TYPE})):
+                    response = await client.get("/bins", params=params, headers=headers)
+                    start = time.perf_counter()
+                    for _ in range(args.requests):
+                        await client.get("/bins", params=params, headers=headers)
+                    per_second = args.requests / (time.perf_counter() - start)
+                    print(
+                        f"HTTP /bins, {label:8s} {per_second:8.1f} zapytań/s, "
+                        f"{len(response.content) / 1024:8.1f} KiB ({response.headers['content-type']})"
+                    )
+
+        asyncio.run(run())
+    finally:
+        bin_store.set_bin_store(None)
+
+
+STARTUP_CHILD = """
+import asyncio, sys, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+
+async def main():
+    async with api.app.router.lifespan_context(api.app):
+        started = time.perf_counter()
+        # Klient testowy to narzędzie benchmarku, nie część repliki - jego import nie jest liczony
+        import httpx
+        client_ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for path in sys.argv[1:]:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    raise SystemExit(f"{path}: {response.status_code} {response.text}")
+        print(imported - start, started - imported, time.perf_counter() - client_ready)
+
+asyncio.run(main())
+"""
+
+
+def bench_startup(args):
+    """ Zimny start repliki: baza + zrzut JSON vs obraz bazy + gotowy indeks koszy (build_image.py) """
+    import subprocess
+    import sys
+
+    from bin_store import SNAPSHOT_FILE, index_path
+    from build_image import DB_IMAGE_FILE, build_bin_indexes, build_db_image
+
+    backend = os.path.dirname(os.path.abspath(__file__))
+    lat, lon = KRAKOW_CENTER
+    with tempfile.TemporaryDirectory() as tmp:
+        barcodes = synthetic_db(os.path.join(tmp, "waste.db"), args.products)
+        with open(os.path.join(tmp, SNAPSHOT_FILE), "w", encoding="utf-8") as f:
+            json.dump({"elements": synthetic_elements(args.bins)}, f)
+        paths = [f"/product/{barcodes[0]}", f"/bins?lat={lat}&long={lon}&category=glass"]
+
+        def cold_start(env):
+            # Osobny proces w katalogu z danymi - jak nowa replika
+            env = {**os.environ, "PYTHONPATH": backend, "VOTE_LOG_FILE": os.path.join(tmp, "votes.log"), **env}
+            best = None
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                output = subprocess.run(
+                    [sys.executable, "-c", STARTUP_CHILD, *paths],
+                    cwd=tmp, env=env, capture_output=True, text=True, check=True,
+                ).stdout
+                total = time.perf_counter() - start
+                imported, started, first = map(float, output.split())
+                if best is None or total < best[0]:
+                    best = (total, imported, started, first)
+            return best
+
+        results = {"baza + zrzut JSON": cold_start({})}
+
+        start = time.perf_counter()
+        build_db_image(os.path.join(tmp, "waste.db"), os.path.join(tmp, DB_IMAGE_FILE))
+        build_bin_indexes([os.path.join(tmp, SNAPSHOT_FILE)])
+        print(
+            f"build_image: {time.perf_counter() - start:.2f} s, obraz bazy "
+            f"{os.path.getsize(os.path.join(tmp, DB_IMAGE_FILE)) / 2**20:.1f} MB, indeks koszy "
+            f"{os.path.getsize(index_path(os.path.join(tmp, SNAPSHOT_FILE))) / 2**20:.1f} MB"
+        )
+        results["obraz bazy + indeks"] = cold_start({"DB_IMAGE": DB_IMAGE_FILE})
+
+    print(f"{args.products} produktów, {args.bins} koszy; najlepszy z {args.repeats} startów")
+    for label, (total, imported, started, first) in results.items():
+        print(
+            f"{label:22s} gotowy po {total:6.2f} s: import {imported:5.2f} s, "
+            f"lifespan {started:5.2f} s, pierwsze /product i /bins {first:5.2f} s"
+        )
+    # Cały czas do pierwszej odpowiedzi: import api (leniwe importy), lifespan i pierwsze zapytania
+    _, imported, started, first = results["obraz bazy + indeks"]
+    ready = imported + started + first
+    if args.max_seconds is not None and ready > args.max_seconds:
+        print(f"Start z obrazu trwał {ready:.2f} s, limit {args.max_seconds:.2f} s")
+        raise SystemExit(1)
+
+
+def bench_regions(args):
+    """ Kosze podzielone na regiony: koszt wczytywania i zwalniania regionów """
+    from regions import Region, RegionIndex
+
+    # Siatka przylegających do siebie regionów 0.1° x 0.15°, kosze aż do krawędzi
+    side = math.ceil(math.sqrt(args.regions))
+    regions, elements = [], {}
+    for i in range(args.regions):
+        south, west = 50.0 + (i // side) * 0.1, 19.0 + (i % side) * 0.15
+        region = Region(f"r{i}", f"r{i}", "8", (south, west, south + 0.1, west + 0.15))
+        regions.append(region)
+        center = (south + 0.05, west + 0.075)
+        elements[region.name] = [
+            {**element, "id": i * args.bins_per_region + element["id"]}
+            for element in synthetic_elements(args.bins_per_region, seed=i, center=center, spread_deg=0.05)
+        ]
+
+    def loader(name):
+        return BinStore(elements[name])
+
+    everything = BinStore([element for region in regions for element in elements[region.name]])
+
+    # Użytkownicy w jednym mieście naraz (kolejne miasta po kolei) i zupełnie losowo
+    per_city = max(1, args.queries // len(regions))
+    local_points = [
+        point
+        for i, region in enumerate(regions)
+        for point in random_points(
+            per_city, seed=100 + i,
+            center=(region.bbox[0] + 0.05, region.bbox[1] + 0.075), spread_deg=0.05,
+        )
+    ]
+    rng = random.Random(7)
+    uniform_points = [
+        (50.0 + rng.uniform(0, 0.1 * math.ceil(args.regions / side)), 19.0 + rng.uniform(0, 0.15 * side))
+        for _ in range(len(local_points))
+    ]
+
+    budget = args.max_loaded * args.bins_per_region
+    print(f"{len(regions)} regionów po {args.bins_per_region} koszy, limit pamięci: {args.max_loaded} regionów")
+    everything.nearest(*uniform_points[0], args.k, "glass")
+    per_call = time_per_call(lambda lat, lon: everything.nearest(lat, lon, args.k, "glass"), uniform_points)
+    print(f"{'jeden indeks, wszystko w pamięci':34s} {'':11s}{1 / per_call:8.0f} zapytań/s (ciepły)")
+    for label, points in (("miasto po mieście", local_points), ("losowo", uniform_points)):
+        for max_bins in (math.inf, budget):
+            index = RegionIndex(regions, loader=loader, max_bins=max_bins, default=None)
+            # Pierwszy przebieg wczytuje regiony; drugi pokazuje stan ustalony
+            cold = time_per_call(lambda lat, lon: index.nearest(lat, lon, args.k, "glass"), points)
+            warm = time_per_call(lambda lat, lon: index.nearest(lat, lon, args.k, "glass"), points)
+            limit = "bez limitu" if max_bins == math.inf else "z limitem"
+            print(
+                f"{label + ', ' + limit:34s} {1 / cold:8.0f} / {1 / warm:8.0f} zapytań/s (zimny / ciepły), "
+                f"wczytań {index.loads:5d}, zwolnień {index.evictions:5d}, "
+                f"w pamięci {len(index.loaded_regions()):3d} regionów"
+            )
+
+
+@contextlib.contextmanager
+def local_http_server(respond):
+    """
+    Lokalny serwer HTTP w wątku tła. respond(path) zwraca (status, obiekt JSON);
+    może spać, żeby udawać wolny serwer. Zwraca adres http://127.0.0.1:port.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body = respond(self.path)
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            try:
+                self.wfile.write(payload)
+            except ConnectionError:
+                # Klient zrezygnował wcześniej (np. przekroczony czas oczekiwania)
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextlib.contextmanager
+def mock_off_server(latency=0.05, error_rate=0.05, missing_rate=0.1, seed=4):
+    """
+    Lokalny serwer udający API produktów Open Food Facts: odpowiada po
+    latency sekundach, część zapytań kończy 429, część kodów zwraca 404.
+    Zwraca adres bazowy API.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def respond(path):
+        barcode = path.split("?")[0].rsplit("/", 1)[-1].removesuffix(".json")
+        time.sleep(latency)
+        with lock:
+            throttled = rng.random() < error_rate
+        # Brak produktu zależy tylko od kodu, żeby wynik był powtarzalny
+        missing = random.Random(barcode).random() < missing_rate
+        if throttled:
+            return 429, {"status": 0}
+        if missing:
+            return 404, {"status": 0, "status_verbose": "product not found"}
+        return 200, {"status": 1, "product": {
+            "code": barcode,
+            "product_name": f"Produkt {barcode}",
+            "categories_hierarchy": ["en:beverages", "en:waters"],
+            "packaging_materials_tags": ["en:plastic"],
+            "ecoscore_score": 50,
+        }}
+
+    with local_http_server(respond) as url:
+        yield f"{url}/api/v2/product"
+
+
+def bench_votes(args):
+    """ Weryfikacje produktów: UPDATE i commit na każdy głos vs kolejka zapisywana partiami (votes.py) """
+    import httpx
+
+    import api
+    import db
+    import votes
+
+    rng = random.Random(12)
+
+    def run_threads(fn, votes_per_thread):
+        threads = [threading.Thread(target=fn, args=(chunk,)) for chunk in votes_per_thread]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    def verifications(barcodes):
+        conn = db.get_connection()
+        total = 0
+        for i in range(0, len(barcodes), 500):
+            chunk = barcodes[i:i + 500]
+            total += conn.execute(
+                f"SELECT SUM(number_of_verifications) FROM Product WHERE barcode IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchone()[0] or 0
+        return total
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "votes.db")
+        barcodes = synthetic_db(db_path, args.products)
+        sample = [rng.choice(barcodes) for _ in range(args.votes)]
+        chunks = [sample[i::args.threads] for i in range(args.threads)]
+        db.pool = db.ConnectionPool(db_path)
+        try:
+            # Dotychczasowy sposób: osobna transakcja na każdy głos
+            def per_vote(chunk):
+                conn = db.get_connection()
+                for barcode in chunk:
+                    conn.execute(votes.VERIFY_UPDATE, (1, barcode))
+                    conn.commit()
+
+            elapsed = run_threads(per_vote, chunks)
+            naive = len(sample) / elapsed
+            assert verifications(barcodes) == len(sample)
+            print(f"UPDATE + commit na głos ({args.threads} wątków): {naive:10.0f} głosów/s")
+
+            queue = votes.VoteQueue(os.path.join(tmp, "votes.log"), interval=args.interval)
+            queue.start()
+
+            def batched(chunk):
+                for barcode in chunk:
+                    queue.verify(barcode)
+
+            elapsed = run_threads(batched, chunks)
+            ingested = len(sample) / elapsed
+            start = time.perf_counter()
+            queue.stop()
+            elapsed += time.perf_counter() - start
+            assert verifications(barcodes) == 2 * len(sample)
+            print(
+                f"kolejka + dziennik ({args.threads} wątków):      {ingested:10.0f} głosów/s przyjętych, "
+                f"{len(sample) / elapsed:.0f} głosów/s razem z zapisem do bazy  (x{len(sample) / elapsed / naive:.0f})"
+            )
+            print(f"  {queue.flushes} transakcji zamiast {len(sample)}")
+
+            # Restart bez zapisu do bazy: głosy wracają z dziennika
+            log_file = os.path.join(tmp, "crash.log")
+            queue = votes.VoteQueue(log_file, interval=3600)
+            queue.start()
+            for barcode in sample[:1000]:
+                queue.verify(barcode)
+            queue.suggest_category(barcodes[0], "glass")
+            # "Awaria": wątek zapisu śpi do końca benchmarku, kolejka jest porzucana
+            replayed = votes.VoteQueue(log_file, interval=3600)
+            replayed.start()
+            assert replayed.replayed == 1001, replayed.replayed
+            # Awaria po commicie, a przed przycięciem dziennika: ponowne odtworzenie nie dubluje głosów
+            shutil.copy(log_file, f"{log_file}.copy")
+            replayed.stop()
+            shutil.copy(f"{log_file}.copy", log_file)
+            again = votes.VoteQueue(log_file, interval=3600)
+            again.start()
+            assert again.replayed == 0, again.replayed
+            again.stop()
+            assert verifications(barcodes) == 2 * len(sample) + 1000
+            print("restart: 1001 niezapisanych głosów odtworzonych z dziennika, zapisane nie są liczone drugi raz")
+
+            # HTTP: odpowiedź od razu uwzględnia głos, zanim trafi do bazy
+            product_cache, vote_queue = api.product_cache, api.vote_queue
+            api.product_cache = LRUCache(maxsize=args.products, ttl=3600)
+            api.vote_queue = votes.VoteQueue(
+                os.path.join(tmp, "http.log"), interval=args.interval, on_flush=api.invalidate_products
+            )
+
+            async def run():
+                transport = httpx.ASGITransport(app=api.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                    before = (await client.get(f"/product/{sample[0]}")).json()["number_of_verifications"]
+                    response = await client.post(f"/product/{sample[0]}/verify")
+                    assert response.status_code == 202
+                    assert response.json()["number_of_verifications"] == before + 1
+                    assert (await client.get(f"/product/{sample[0]}")).json()["number_of_verifications"] == before + 1
+                    queue = list(sample[1:args.http_votes + 1])
+
+                    async def worker():
+                        while queue:
+                            response = await client.post(f"/product/{queue.pop()}/verify")
+                            assert response.status_code == 202, response.text
+
+                    start = time.perf_counter()
+                    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+                    return min(args.http_votes, len(sample) - 1) / (time.perf_counter() - start)
+
+            try:
+                http_rate = asyncio.run(run())
+                api.vote_queue.stop()
+            finally:
+                api.product_cache, api.vote_queue = product_cache, vote_queue
+            print(f"POST /product/{{barcode}}/verify:           {http_rate:10.0f} głosów/s")
+        finally:
+            db.pool.close_all()
+
+
+def bench_scraper(args):
+    """ Sekwencyjna pętla z data_scrapper vs asynchroniczny off_scraper na lokalnym serwerze """
+    from data_scrapper import fetch_product_data_from_api
+    from off_cache import OFFResponseCache
+    from off_scraper import scrape_barcodes
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    barcodes = [f"590{i:010d}" for i in range(args.barcodes)]
+
+    with mock_off_server(args.latency, args.error_rate) as api_url, tempfile.TemporaryDirectory() as tmp:
+        # Dotychczasowa pętla bez time.sleep(0.5) - realnie jest jeszcze wolniejsza.
+        # Osobny cache, żeby nie rozgrzać go przed przebiegiem asynchronicznym.
+        sequential_cache = OFFResponseCache(os.path.join(tmp, "sequential_cache.db"))
+        start = time.perf_counter()
+        sequential_found = sum(
+            fetch_product_data_from_api(barcode, api_url, sequential_cache) is not None for barcode in barcodes
+        )
+        sequential = len(barcodes) / (time.perf_counter() - start)
+        sequential_cache.close()
+
+        cache = OFFResponseCache(os.path.join(tmp, "off_cache.db"))
+        output = os.path.join(tmp, "products.jsonl")
+        options = dict(
+            concurrency=args.concurrency, rate=args.rate, api_url=api_url,
+            checkpoint_every=50, backoff=0.05, cache=cache,
+        )
+        # Przerwany przebieg: pierwsza połowa, potem wznowienie na całej liście
+        first = asyncio.run(scrape_barcodes(barcodes[:len(barcodes) // 2], output, **options))
+        resumed = asyncio.run(scrape_barcodes(barcodes, output, **options))
+        with open(output, "r", encoding="utf-8") as f:
+            written = [json.loads(line)["barcode"] for line in f]
+        # Nowy plik wynikowy, ten sam cache - odpowiedzi nie idą już przez sieć
+        rerun = asyncio.run(scrape_barcodes(barcodes, os.path.join(tmp, "rerun.jsonl"), **options))
+        cache.close()
+
+    assert resumed["skipped"] == len(barcodes) // 2 - first["failed"], (first, resumed)
+    assert len(written) == len(set(written)), "zduplikowane produkty po wznowieniu"
+
+    print(f"sekwencyjnie:  {sequential:8.1f} kodów/s  (znaleziono {sequential_found}, bez ponawiania 429)")
+    print(
+        f"asynchronicznie: {resumed['per_second']:6.1f} kodów/s  (x{resumed['per_second'] / sequential:.1f}), "
+        f"znaleziono {len(written)}, błędy {first['failed'] + resumed['failed']}"
+    )
+    print(f"wznowienie pominęło {resumed['skipped']} już pobranych kodów")
+    print(
+        f"ponowny przebieg z cache: {rerun['per_second']:6.1f} kodów/s, "
+        f"trafienia {rerun['cache']['hit_ratio']:.1%} ({rerun['cache']['negative_hits']} zapamiętanych braków)"
+    )
+
+
+def write_sample_dump(path, size_mb, seed=5):
+    """ Zapisuje syntetyczny zrzut OFF (JSONL.gz) o rozmiarze ok. size_mb MB po rozpakowaniu """
+    rng = random.Random(seed)
+    countries = ["en:poland", "en:germany", "en:france", "en:czech-republic"]
+    # Prawdziwe linie zrzutu mają kilka KB, głównie pola, których nie używamy
+    filler = "x" * 2000
+    limit = size_mb * 2**20
+    size = 0
+    i = 0
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as f:
+        while size < limit:
+            line = json.dumps({
+                "code": f"{5900000000000 + i}",
+                "product_name": f"Produkt {i}",
+                "countries_tags": rng.sample(countries, rng.randint(1, 2)),
+                "categories_hierarchy": ["en:beverages", rng.choice(["en:waters", "en:juices", "en:sodas"])],
+                "packaging_materials_tags": [rng.choice(["en:plastic", "en:glass", "en:metal"])],
+                "ecoscore_score": rng.randint(0, 100),
+                "ecoscore_data": {"agribalyse": {"co2_total": rng.random()}},
+                "image_front_url": f"https://images.example/{i}.jpg",
+                "ingredients_text": filler,
+            }) + "\n"
+            f.write(line)
+            size += len(line)
+            i += 1
+    return i
+
+
+def bench_dump(args):
+    """ Przepustowość off_dump.process_dump dla rosnącej liczby procesów """
+    from off_dump import process_dump
+
+    worker_counts = [n for n in (1, 2, 4, 8, 16, 32) if n <= args.max_workers]
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, "sample.jsonl.gz")
+        start = time.perf_counter()
+        products = write_sample_dump(dump, args.size_mb)
+        print(
+            f"Zrzut: {products} produktów, {args.size_mb} MB po rozpakowaniu, "
+            f"{os.path.getsize(dump) / 2**20:.0f} MB gz ({time.perf_counter() - start:.1f} s)"
+        )
+
+        baseline = None
+        for workers in worker_counts:
+            result = process_dump(dump, os.path.join(tmp, "out.jsonl"), countries={"en:poland"}, workers=workers)
+            lines_per_s = result["lines"] / result["elapsed"]
+            baseline = baseline or lines_per_s
+            print(
+                f"{workers:3d} procesów: {lines_per_s:10.0f} linii/s  (x{lines_per_s / baseline:.2f}), "
+                f"zapisano {result['written']}"
+            )
+
+    # ru_maxrss w KB (Linux); dzieci to procesy robocze
+    parent = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"Szczyt pamięci: proces główny {parent:.0f} MB, największy proces roboczy {children:.0f} MB")
+
+
+def synthetic_off_products(n, packagings=50, seed=9):
+    """ Odpowiedzi OFF ('product') z długimi listami opakowań, kategorii i nazw - dla extract_product_info """
+    rng = random.Random(seed)
+    materials = ["en:plastic", "en:glass", "en:metal", "en:paper", "en:cardboard", ""]
+    products = []
+    for i in range(n):
+        products.append({
+            "code": f"{5900000000000 + i}",
+            "product_name": [{"lang": rng.choice(["pl", "de", "fr"]), "text": f"Produkt {i}"} for _ in range(10)]
+            + [{"lang": "en", "text": f"Product {i}"}],
+            "categories_hierarchy": [f"pl:kategoria-{j}" for j in range(20)] + ["en:beverages", "en:waters"],
+            # Bez packaging_materials_tags - ekstrakcja przechodzi przez całą listę packagings
+            "packagings": [{"material": rng.choice(materials), "shape": "en:bottle"} for _ in range(packagings)],
+            "packaging": "Plastik, szkło",
+            "ecoscore_score": rng.randint(0, 100),
+            "ecoscore_data": {"agribalyse": {"co2_total": rng.random()}},
+            "selected_images": {"front": {"display": {"pl": f"https://images.example/{i}.jpg"}}},
+        })
+    return products
+
+
+def synthetic_db(path, products, seed=10):
+    """ Baza produktów (schemat init_db + migracje) z products syntetycznymi wierszami; zwraca kody """
+    from init_db import bulk_import
+
+    rng = random.Random(seed)
+    records = [
+        {
+            "name": f"Produkt {i}",
+            "barcode": f"{5900000000000 + i}",
+            "type": rng.choice(["waters", "juices", "sodas", "snacks"]),
+            "packaging_material": rng.choice(["plastic", "glass", "metal", "paper"]),
+            "green_score": rng.randint(0, 100),
+            "carbon_footprint": rng.random(),
+            "image_url": f"https://images.example/{i}.jpg",
+        }
+        for i in range(products)
+    ]
+    records_file = f"{path}.jsonl"
+    with open(records_file, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(record) + "\n" for record in records)
+    with contextlib.redirect_stdout(None):
+        bulk_import(records_file, path)
+    os.unlink(records_file)
+    return [record["barcode"] for record in records]
+
+
+# Najkrótszy pomiar jednego przebiegu - krótsze listy wywołań są powtarzane
+MIN_SAMPLE_S = 0.5
+
+
+def best_rate(fn, calls, repeats, min_time=MIN_SAMPLE_S):
+    """
+    Wywołań na sekundę w najszybszym z repeats przebiegów - mniej wrażliwe na
+    szum niż średnia. Przebieg powtarza listę calls tyle razy, żeby trwał co
+    najmniej min_time, a GC jest na czas pomiaru wyłączony (jak w timeit).
+    """
+    start = time.perf_counter()
+    for args in calls:
+        fn(*args)
+    passes = max(1, math.ceil(min_time / max(time.perf_counter() - start, 1e-9)))
+
+    best = math.inf
+    gc_enabled = gc.isenabled()
+    try:
+        for _ in range(repeats):
+            gc.collect()
+            gc.disable()
+            start = time.perf_counter()
+            for _ in range(passes):
+                for args in calls:
+                    fn(*args)
+            best = min(best, time.perf_counter() - start)
+            if gc_enabled:
+                gc.enable()
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return passes * len(calls) / best
+
+
+def run_suite(args):
+    """ Śledzone metryki (operacji/s, więcej = lepiej) na danych syntetycznych, bez sieci """
+    import api
+    import bin_store
+    import db
+    from closest_bin import closest_bin
+    from data_scrapper import extract_product_info
+    from fetch_waste_bins import fetch_waste_bins
+    from regions import DEFAULT_REGION, get_region_index
+
+    # data_scrapper włącza logi INFO - wypisywanie każdego zapytania zafałszowałoby pomiar
+    logging.getLogger().setLevel(logging.WARNING)
+    results = {}
+    rng = random.Random(11)
+
+    def record(name, value, unit):
+        results[name] = round(value, 1)
+        print(f"{name:28s} {value:12.1f} {unit}")
+
+    # Kosze
+    store = BinStore(synthetic_elements(args.bins))
+    bin_lats, bin_lons = store.lats.tolist(), store.lons.tolist()
+    points = random_points(args.queries)
+    pairs = [(lat, lon, bin_lats[i % len(bin_lats)], bin_lons[i % len(bin_lons)]) for i, (lat, lon) in enumerate(points)]
+    record("haversine_distance", best_rate(haversine_distance, pairs, args.repeats), "wywołań/s")
+
+    get_region_index().set_store(DEFAULT_REGION, store)
+    try:
+        calls = [(lat, lon, rng.choice(BIN_CATEGORIES)) for lat, lon in points]
+        fetch_waste_bins(*calls[0])
+        record("fetch_waste_bins", best_rate(fetch_waste_bins, calls, args.repeats), "zapytań/s")
+        calls = [(lat, lon, rng.choice(BIN_CATEGORIES), 5) for lat, lon in points]
+        record("closest_bin", best_rate(closest_bin, calls, args.repeats), "zapytań/s")
+
+        # Produkty
+        payloads = [(product,) for product in synthetic_off_products(args.payloads, args.payload_items)]
+        record("extract_product_info", best_rate(extract_product_info, payloads, args.repeats), "produktów/s")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            barcodes = synthetic_db(os.path.join(tmp, "suite.db"), args.products)
+            db.pool = db.ConnectionPool(os.path.join(tmp, "suite.db"))
+            product_cache = api.product_cache
+            api.product_cache = LRUCache(maxsize=args.products, ttl=3600)
+            try:
+                sample = [(rng.choice(barcodes),) for _ in range(args.queries)]
+                record("product_miss", best_rate(api.load_or_create_product, sample, args.repeats), "zapytań/s")
+                for barcode, in sample:
+                    api.get_or_create_product(barcode)
+                record("product_hit", best_rate(api.get_or_create_product, sample, args.repeats), "zapytań/s")
+                # Każdy przebieg zakłada inne, nowe kody
+                created = (f"new-{i}" for i in itertools.count())
+                record("product_create", best_rate(
+                    lambda: api.load_or_create_product(next(created)), [()] * args.queries, args.repeats,
+                ), "zapytań/s")
+
+                # HTTP przez całą aplikację (middleware, walidacja, serializacja)
+                paths = [f"/product/{barcode}" for barcode, in sample]
+                record("http_product", max(
+                    asyncio.run(http_load(api.app, paths, args.concurrency)) for _ in range(args.repeats)
+                ), "zapytań/s")
+                paths = [f"/bins?lat={lat}&long={lon}&category=glass" for lat, lon in points]
+                record("http_bins", max(
+                    asyncio.run(http_load(api.app, paths, args.concurrency)) for _ in range(args.repeats)
+                ), "zapytań/s")
+                paths = [f"/closest_bin?x={lat}&y={lon}&type_=glass&k=5" for lat, lon in points]
+                record("http_closest_bin", max(
+                    asyncio.run(http_load(api.app, paths, args.concurrency)) for _ in range(args.repeats)
+                ), "zapytań/s")
+            finally:
+                db.pool.close_all()
+                api.product_cache = product_cache
+    finally:
+        bin_store.set_bin_store(None)
+    return results
+
+
+# Metryki z zapisem do bazy i przez HTTP wahają się między przebiegami na
+# niezmienionym kodzie bardziej niż pozostałe (checkpointy WAL, pętla zdarzeń) -
+# dla nich próg regresji jest co najmniej taki
+METRIC_THRESHOLDS = {
+    "product_create": 0.3,
+    "http_product": 0.25,
+    "http_bins": 0.25,
+    "http_closest_bin": 0.25,
+}
+
+
+def compare_results(results, baseline, threshold):
+    """ Nazwy metryk, które spadły o więcej niż threshold (albo próg z METRIC_THRESHOLDS) względem baseline """
+    regressions = []
+    for name, base in sorted(baseline["metrics"].items()):
+        current = results.get(name)
+        if current is None:
+            print(f"{name:28s} brak w bieżącym przebiegu")
+            continue
+        change = current / base - 1 if base else 0.0
+        flag = ""
+        if change < -max(threshold, METRIC_THRESHOLDS.get(name, 0.0)):
+            flag = "  REGRESJA"
+            regressions.append(name)
+        print(f"{name:28s} {base:12.1f} -> {current:12.1f}  ({change:+.1%}){flag}")
+    return regressions
+
+
+def bench_suite(args):
+    """
+    Powtarzalny zestaw benchmarków ścieżek krytycznych. Wynik zapisywany
+    jako JSON; z --baseline porównywany z wcześniejszym zapisem - spadek
+    którejś metryki o więcej niż --threshold (w najlepszym z --attempts
+    przebiegów) kończy się kodem 1.
+    """
+    params = {
+        name: getattr(args, name)
+        for name in ("bins", "products", "queries", "payloads", "payload_items", "concurrency", "repeats")
+    }
+    results = run_suite(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            print(f"Uwaga: inne parametry niż w {args.baseline}: {baseline.get('params')}")
+        print(f"Porównanie z {args.baseline} (próg {args.threshold:.0%}):")
+        regressions = compare_results(results, baseline, args.threshold)
+        # Spadek bywa chwilowym spowolnieniem całej maszyny - regresja musi się powtórzyć
+        # w kolejnych przebiegach; z każdego przebiegu liczy się najlepszy wynik metryki
+        for attempt in range(2, args.attempts + 1):
+            if not regressions:
+                break
+            print(f"Ponowny pomiar ({attempt}/{args.attempts}) po spadku: {', '.join(regressions)}")
+            again = run_suite(args)
+            results = {name: max(value, again.get(name, value)) for name, value in results.items()}
+            print(f"Porównanie z {args.baseline}, najlepsze z {attempt} przebiegów:")
+            regressions = compare_results(results, baseline, args.threshold)
+
+    report = {
+        "params": params,
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "metrics": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Zapisano wyniki do {args.output}")
+
+    if baseline is not None and regressions:
+        print(f"Regresje: {', '.join(regressions)}")
+        raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    closest = subparsers.add_parser("closest_bin", help="k najbliższych koszy vs pełny skan")
+    closest.add_argument("--bins", type=int, default=100_000)
+    closest.add_argument("--queries", type=int, default=1000)
+    closest.add_argument("--k", type=int, default=5)
+    closest.set_defaults(func=bench_closest_bin)
+
+    distance = subparsers.add_parser("distance", help="haversine skalarny vs NumPy")
+    distance.add_argument("--bins", type=int, default=100_000)
+    distance.add_argument("--users", type=int, default=2000)
+    distance.set_defaults(func=bench_distance)
+
+    product = subparsers.add_parser("product", help="przepustowość GET /product/{barcode}")
+    product.add_argument("--requests", type=int, default=5000)
+    product.add_argument("--concurrency", type=int, default=32)
+    product.set_defaults(func=bench_product)
+
+    batch = subparsers.add_parser("product_batch", help="pojedyncze GET vs POST /products/batch")
+    batch.add_argument("--requests", type=int, default=5000)
+    batch.add_argument("--batch-size", type=int, default=200)
+    batch.set_defaults(func=bench_product_batch)
+
+    mixed = subparsers.add_parser("mixed", help="p99 /product przy wolnym Overpass za /bins")
+    mixed.add_argument("--requests", type=int, default=3000)
+    mixed.add_argument("--concurrency", type=int, default=16)
+    mixed.add_argument("--bins-concurrency", type=int, default=64)
+    mixed.add_argument("--overpass-latency", type=float, default=2.0)
+    mixed.set_defaults(func=bench_mixed)
+
+    herd = subparsers.add_parser("herd", help="łączenie równoległych identycznych pobrań")
+    herd.add_argument("--clients", type=int, default=200)
+    herd.add_argument("--overpass-latency", type=float, default=0.5)
+    herd.set_defaults(func=bench_herd)
+
+    tiles = subparsers.add_parser("tiles", help="/bins vs gotowe kafelki z ETag")
+    tiles.add_argument("--bins", type=int, default=20_000)
+    tiles.add_argument("--requests", type=int, default=2000)
+    tiles.set_defaults(func=bench_tiles)
+
+    serialization = subparsers.add_parser("serialization", help="serializacja odpowiedzi: json vs orjson, wiersze vs kolumny")
+    serialization.add_argument("--bins", type=int, default=10_000, help="koszy w jednej odpowiedzi /bins")
+    serialization.add_argument("--payload-items", type=int, default=200, help="produktów w odpowiedzi batch")
+    serialization.add_argument("--repeats", type=int, default=50)
+    serialization.add_argument("--requests", type=int, default=100)
+    serialization.set_defaults(func=bench_serialization)
+
+    startup = subparsers.add_parser("startup", help="zimny start: zrzut JSON vs obraz bazy i gotowy indeks koszy")
+    startup.add_argument("--products", type=int, default=50_000)
+    startup.add_argument("--bins", type=int, default=200_000)
+    startup.add_argument("--repeats", type=int, default=3)
+    startup.add_argument("--max-seconds", type=float, default=None,
+                         help="kod 1, gdy start z obrazu (import api, lifespan i pierwsze zapytania) trwa dłużej")
+    startup.set_defaults(func=bench_startup)
+
+    regions = subparsers.add_parser("regions", help="kosze podzielone na regiony: granice i zwalnianie")
+    regions.add_argument("--regions", type=int, default=36)
+    regions.add_argument("--bins-per-region", type=int, default=5000)
+    regions.add_argument("--max-loaded", type=int, default=4, help="ile regionów mieści limit pamięci")
+    regions.add_argument("--queries", type=int, default=1000)
+    regions.add_argument("--k", type=int, default=5)
+    regions.set_defaults(func=bench_regions)
+
+    votes = subparsers.add_parser("votes", help="weryfikacje produktów: commit na głos vs zapis partiami")
+    votes.add_argument("--products", type=int, default=20_000)
+    votes.add_argument("--votes", type=int, default=20_000)
+    votes.add_argument("--threads", type=int, default=8)
+    votes.add_argument("--interval", type=float, default=0.2, help="co ile sekund zapis partii")
+    votes.add_argument("--http-votes", type=int, default=3000)
+    votes.add_argument("--concurrency", type=int, default=16)
+    votes.set_defaults(func=bench_votes)
+
+    scraper = subparsers.add_parser("scraper", help="pobieranie produktów z OFF: sekwencyjnie vs asyncio")
+    scraper.add_argument("--barcodes", type=int, default=500)
+    scraper.add_argument("--latency", type=float, default=0.05, help="opóźnienie odpowiedzi serwera w s")
+    scraper.add_argument("--error-rate", type=float, default=0.05, help="odsetek odpowiedzi 429")
+    scraper.add_argument("--concurrency", type=int, default=16)
+    scraper.add_argument("--rate", type=float, default=1000, help="limit zapytań/s")
+    scraper.set_defaults(func=bench_scraper)
+
+    dump = subparsers.add_parser("dump", help="równoległa ekstrakcja ze zrzutu OFF")
+    dump.add_argument("--size-mb", type=int, default=256, help="rozmiar zrzutu po rozpakowaniu")
+    dump.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    dump.set_defaults(func=bench_dump)
+
+    suite = subparsers.add_parser("suite", help="śledzone metryki z zapisem JSON i porównaniem z poprzednim wynikiem")
+    suite.add_argument("--bins", type=int, default=100_000)
+    suite.add_argument("--products", type=int, default=50_000)
+    suite.add_argument("--queries", type=int, default=2000)
+    suite.add_argument("--payloads", type=int, default=2000, help="odpowiedzi OFF dla extract_product_info")
+    suite.add_argument("--payload-items", type=int, default=50, help="opakowań w jednej odpowiedzi")
+    suite.add_argument("--concurrency", type=int, default=16)
+    suite.add_argument("--repeats", type=int, default=9, help="przebiegów każdej metryki (liczy się najlepszy)")
+    suite.add_argument("--output", default=None, help="zapisz wyniki do pliku JSON")
+    suite.add_argument("--baseline", default=None, help="plik JSON z wynikami do porównania")
+    suite.add_argument("--threshold", type=float, default=0.2, help="dopuszczalny spadek metryki (0.2 = 20%%)")
+    suite.add_argument("--attempts", type=int, default=3,
+                       help="ile razy najwyżej zmierzyć zestaw, zanim spadek zostanie uznany za regresję")
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
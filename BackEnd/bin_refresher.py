@@ -0,0 +1,130 @@
+import argparse
+import logging
+import threading
+
+import bin_store
+import metrics
+from bin_store import SNAPSHOT_FILE, BinStore, index_path, load_bin_store
+from fetch_waste_bins import OVERPASS_URL, fetch_snapshot, snapshot_query, write_snapshot
+from regions import DEFAULT_REGION, REGIONS, get_region_index, region_snapshot_path
+
+DEFAULT_INTERVAL_S = 6 * 60 * 60
+
+
+def diff_elements(old_versions, elements):
+    """
+    Porównuje nowy zrzut z obecnym po id węzła OSM i jego wersji.
+
+    Args:
+        old_versions: Słownik {id: wersja} obecnego zrzutu.
+        elements: Węzły z nowego zrzutu.
+
+    Returns:
+        Słownik z listami id: added, changed, removed.
+    """
+    new_versions = {element.get("id"): element.get("version") for element in elements}
+    added = [node_id for node_id in new_versions if node_id not in old_versions]
+    changed = [
+        node_id for node_id, version in new_versions.items()
+        if node_id in old_versions and old_versions[node_id] != version
+    ]
+    removed = [node_id for node_id in old_versions if node_id not in new_versions]
+    return {"added": added, "changed": changed, "removed": removed}
+
+
+def current_versions(path=SNAPSHOT_FILE, region=DEFAULT_REGION):
+    """ Wersje węzłów w obecnie używanym indeksie (pusty słownik, gdy brak zrzutu) """
+    try:
+        if region == DEFAULT_REGION:
+            store = bin_store.get_bin_store(path)
+        else:
+            store = load_bin_store(path)
+    except (OSError, ValueError):
+        return {}
+    return dict(zip(store.ids, store.versions))
+
+
+def refresh_bins(source=OVERPASS_URL, path=SNAPSHOT_FILE, region=DEFAULT_REGION):
+    """
+    Pobiera świeży zrzut koszy i, jeśli coś się zmieniło, zapisuje go
+    atomowo i podmienia indeks w pamięci.
+
+    Args:
+        source: Adres serwera Overpass albo ścieżka do pliku ze zrzutem.
+        path: Plik, w którym trzymany jest obecny zrzut.
+        region: Nazwa regionu z regions.REGIONS, którego dotyczy zrzut.
+
+    Returns:
+        Słownik z różnicą (added/changed/removed).
+    """
+    data = fetch_snapshot(source, snapshot_query(REGIONS[region]))
+    elements = data.get("elements", [])
+    diff = diff_elements(current_versions(path, region), elements)
+
+    if not any(diff.values()):
+        logging.info("Zrzut koszy bez zmian.")
+        return diff
+
+    # Nowy indeks jest budowany obok starego, który dalej obsługuje zapytania
+    new_store = BinStore(elements)
+    write_snapshot(data, path)
+    # Gotowy indeks obok zrzutu - kolejne repliki nie parsują JSON przy starcie
+    new_store.save_index(index_path(path))
+    get_region_index().set_store(region, new_store)
+    logging.info(
+        f"Zaktualizowano zrzut koszy ({region}): +{len(diff['added'])} ~{len(diff['changed'])} "
+        f"-{len(diff['removed'])}, razem {len(new_store)}."
+    )
+    return diff
+
+
+class BinRefresher:
+    """ Wątek w tle odświeżający zrzut koszy co interval sekund """
+
+    def __init__(self, interval=DEFAULT_INTERVAL_S, source=OVERPASS_URL, path=SNAPSHOT_FILE, region=DEFAULT_REGION):
+        self.interval = interval
+        self.source = source
+        self.path = path
+        self.region = region
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="bin-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                refresh_bins(self.source, self.path, self.region)
+            except Exception as e:
+                # Błąd odświeżania nie może zatrzymać serwowania starego zrzutu
+                logging.error(f"Nie udało się odświeżyć zrzutu koszy: {e}")
+                metrics.upstream_errors.inc("overpass", type(e).__name__)
+            self._stop.wait(self.interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Odświeżanie zrzutu koszy z Overpass")
+    parser.add_argument("--source", default=OVERPASS_URL, help="adres Overpass albo plik ze zrzutem")
+    parser.add_argument("--region", default=DEFAULT_REGION, choices=sorted(REGIONS), help="region (miasto) zrzutu")
+    parser.add_argument("--path", default=None, help="plik zrzutu używany przez API (domyślnie plik regionu)")
+    parser.add_argument("--interval", type=float, default=None, help="odświeżaj co N sekund zamiast raz")
+    args = parser.parse_args()
+    path = args.path or region_snapshot_path(args.region)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.interval is None:
+        refresh_bins(args.source, path, args.region)
+    else:
+        refresher = BinRefresher(args.interval, args.source, path, args.region)
+        refresher.start()
+        try:
+            refresher._thread.join()
+        except KeyboardInterrupt:
+            refresher.stop()
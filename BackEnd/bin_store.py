@@ -0,0 +1,415 @@
+import json
+import math
+import mmap
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from distance import EARTH_RADIUS_KM, haversine_np
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+CELL_SIZE_DEG = 0.01  # ~1.1 km N-S i ~0.7 km W-E w Krakowie
+SNAPSHOT_FILE = "waste_bins_snapshot.json"
+# Kolumny kosza w odpowiedziach API: wiersz [lat, lon, typ, odległość] albo słownik kolumn
+BIN_COLUMNS = ("lat", "lon", "type", "distance")
+
+# Gotowy indeks (build_image.py): nagłówek JSON i tablice NumPy czytane przez mmap
+INDEX_MAGIC = b"BINIDX1\n"
+INDEX_ALIGN = 64
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def index_path(snapshot_path):
+    """ Plik gotowego indeksu obok zrzutu: waste_bins_snapshot.json -> waste_bins_snapshot.index """
+    return os.path.splitext(snapshot_path)[0] + ".index"
+
+
+def matches_type(tags, type_filter):
+    """ Czy kosz pasuje do filtra - tak samo jak w zapytaniu Overpass dla danego typu """
+    if type_filter is None:
+        return True
+    return tags.get("amenity") == "waste_basket" or tags.get(f"recycling:{type_filter}") == "yes"
+
+
+def bin_type(tags, type_filter):
+    """ Typ kosza zwracany przez API """
+    if tags.get("amenity") == "waste_basket":
+        return "waste_basket"
+    if f"recycling:{type_filter}" in tags:
+        return f"{type_filter}"
+    return "unknown"
+
+
+def _api_tags(tags):
+    # Do indeksu trafiają tylko tagi używane przez matches_type i bin_type - dzięki
+    # temu kosze dzielą kilkadziesiąt wspólnych zestawów tagów zamiast mieć własne
+    return {key: value for key, value in tags.items() if key == "amenity" or key.startswith("recycling:")}
+
+
+class _SharedTags:
+    """ Tagi koszy z gotowego indeksu: różne zestawy tagów i numer zestawu każdego kosza """
+
+    __slots__ = ("unique", "ids")
+
+    def __init__(self, unique, ids):
+        self.unique = unique
+        self.ids = ids
+
+    def __getitem__(self, index):
+        return self.unique[self.ids[index]]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        unique = self.unique
+        return (unique[i] for i in self.ids.tolist())
+
+
+def _grid_extent(grid):
+    """ Zakres (row_min, row_max, col_min, col_max) niepustych komórek siatki """
+    if not grid:
+        return None
+    rows = [cell[0] for cell in grid]
+    cols = [cell[1] for cell in grid]
+    return min(rows), max(rows), min(cols), max(cols)
+
+
+class BinStore:
+    """
+    Kosze na śmieci trzymane w pamięci, zaindeksowane siatką komórek o boku
+    cell_size stopni. Zapytanie o promień przegląda tylko komórki, które
+    mogą przecinać się z okręgiem; odległości liczone są wektorowo.
+    """
+
+    def __init__(self, elements, cell_size=CELL_SIZE_DEG):
+        self.cell_size = cell_size
+        self.tags = []
+        self.ids = []
+        self.versions = []
+        self.categories = set()
+        lats = []
+        lons = []
+        cells = {}
+
+        for element in elements:
+            lat = element.get("lat")
+            lon = element.get("lon")
+            if lat is None or lon is None:
+                continue
+            tags = element.get("tags", {})
+            cells.setdefault(self._cell(lat, lon), []).append(len(lats))
+            lats.append(lat)
+            lons.append(lon)
+            self.tags.append(tags)
+            self.ids.append(element.get("id"))
+            self.versions.append(element.get("version"))
+            self.categories.update(
+                key.split(":", 1)[1] for key, value in tags.items()
+                if key.startswith("recycling:") and value == "yes"
+            )
+
+        self._set_index(
+            np.array(lats, dtype=np.float64),
+            np.array(lons, dtype=np.float64),
+            {cell: np.array(indexes, dtype=np.int64) for cell, indexes in cells.items()},
+        )
+
+    def _set_index(self, lats, lons, grid):
+        self.lats = lats
+        self.lons = lons
+        self._grid = grid
+        self._grid_lock = threading.Lock()
+
+        # Najmniejszy cos(lat) w zbiorze ogranicza z dołu odległość w kierunku W-E
+        max_abs_lat = float(np.abs(self.lats).max()) if len(self.lats) else 0.0
+        self._min_cos = math.cos(math.radians(min(max_abs_lat + self.cell_size, 90)))
+        self._category_grids = {None: (self._grid, _grid_extent(self._grid))}
+
+    @classmethod
+    def from_file(cls, path=SNAPSHOT_FILE, **kwargs):
+        """ Wczytuje zrzut odpowiedzi Overpass (format [out:json]) """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("elements", []), **kwargs)
+
+    def save_index(self, path):
+        """
+        Zapisuje indeks w formacie dla from_index (atomowo). Tablice są
+        wyrównane do INDEX_ALIGN bajtów, więc from_index czyta je przez mmap
+        bez kopiowania.
+        """
+        shared = {}
+        tag_ids = np.array(
+            [shared.setdefault(json.dumps(_api_tags(tags), sort_keys=True), len(shared)) for tags in self.tags],
+            dtype=np.int32,
+        )
+        cells = sorted(self._grid)
+        arrays = {
+            "lats": self.lats,
+            "lons": self.lons,
+            "ids": np.array([-1 if v is None else v for v in self.ids], dtype=np.int64),
+            "versions": np.array([-1 if v is None else v for v in self.versions], dtype=np.int64),
+            "tag_ids": tag_ids,
+            "cell_rows": np.array([row for row, _ in cells], dtype=np.int64),
+            "cell_cols": np.array([col for _, col in cells], dtype=np.int64),
+            "cell_offsets": np.cumsum([0] + [len(self._grid[cell]) for cell in cells], dtype=np.int64),
+            "cell_members": np.concatenate([self._grid[cell] for cell in cells]) if cells else _EMPTY,
+        }
+
+        layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            layout[name] = [array.dtype.str, len(array), offset]
+            offset += -(-array.nbytes // INDEX_ALIGN) * INDEX_ALIGN
+        header = json.dumps({
+            "cell_size": self.cell_size,
+            "categories": sorted(self.categories),
+            "tags": [json.loads(tags) for tags in shared],
+            "arrays": layout,
+        }).encode()
+        data_start = -(-(len(INDEX_MAGIC) + 8 + len(header)) // INDEX_ALIGN) * INDEX_ALIGN
+
+        # Własny plik tymczasowy na zapis - odświeżanie w tle i install_snapshot mogą zapisywać naraz
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".waste_bins_", suffix=".index.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(INDEX_MAGIC + len(header).to_bytes(8, "little") + header)
+                for name, array in arrays.items():
+                    f.seek(data_start + layout[name][2])
+                    f.write(np.ascontiguousarray(array).tobytes())
+                f.truncate(data_start + offset)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def from_index(cls, path):
+        """
+        Wczytuje indeks zapisany przez save_index. Współrzędne i siatka to
+        widoki na plik zmapowany w pamięci - strony czyta system przy
+        pierwszym dostępie, nic nie jest parsowane ani kopiowane.
+        """
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"{path} nie jest indeksem koszy")
+        start = len(INDEX_MAGIC) + 8
+        header_size = int.from_bytes(buffer[len(INDEX_MAGIC):start], "little")
+        header = json.loads(buffer[start:start + header_size])
+        data_start = -(-(start + header_size) // INDEX_ALIGN) * INDEX_ALIGN
+        arrays = {
+            name: np.frombuffer(buffer, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+            for name, (dtype, count, offset) in header["arrays"].items()
+        }
+
+        store = cls.__new__(cls)
+        store.cell_size = header["cell_size"]
+        store.categories = set(header["categories"])
+        store.tags = _SharedTags(header["tags"], arrays["tag_ids"])
+        store.ids = [None if v < 0 else v for v in arrays["ids"].tolist()]
+        store.versions = [None if v < 0 else v for v in arrays["versions"].tolist()]
+        offsets = arrays["cell_offsets"].tolist()
+        members = arrays["cell_members"]
+        grid = {
+            (row, col): members[offsets[i]:offsets[i + 1]]
+            for i, (row, col) in enumerate(zip(arrays["cell_rows"].tolist(), arrays["cell_cols"].tolist()))
+        }
+        store._set_index(arrays["lats"], arrays["lons"], grid)
+        return store
+
+    def __len__(self):
+        return len(self.lats)
+
+    def type_mask(self, type_filter):
+        """ Maska koszy pasujących do filtra (matches_type) """
+        tags = self.tags
+        if isinstance(tags, _SharedTags):
+            # Indeks z pliku: filtr sprawdzany raz na zestaw tagów, nie na kosz
+            shared = np.array([matches_type(t, type_filter) for t in tags.unique], dtype=bool)
+            return shared[tags.ids]
+        return np.array([matches_type(t, type_filter) for t in tags], dtype=bool)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def _category_grid(self, type_filter):
+        """
+        Siatka (i jej zasięg) zawierająca tylko kosze pasujące do filtra.
+        Budowana przy pierwszym użyciu; nieznane kategorie pasują tylko
+        do zwykłych koszy.
+        """
+        if type_filter is not None and type_filter not in self.categories:
+            type_filter = ""
+        entry = self._category_grids.get(type_filter)
+        if entry is None:
+            with self._grid_lock:
+                entry = self._category_grids.get(type_filter)
+                if entry is None:
+                    mask = self.type_mask(type_filter)
+                    grid = {}
+                    for cell, indexes in self._grid.items():
+                        matching = indexes[mask[indexes]]
+                        if len(matching):
+                            grid[cell] = matching
+                    entry = (grid, _grid_extent(grid))
+                    self._category_grids[type_filter] = entry
+        return entry
+
+    def _cells_in_radius(self, grid, lat, lon, radius_km):
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        row_min, col_min = self._cell(lat - dlat, lon - dlon)
+        row_max, col_max = self._cell(lat + dlat, lon + dlon)
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                cell = grid.get((row, col))
+                if cell is not None:
+                    yield cell
+
+    def _distances(self, lat, lon, cells):
+        """ Indeksy koszy z podanych komórek i ich odległości od (lat, lon) """
+        if not cells:
+            return _EMPTY, np.empty(0)
+        indexes = np.concatenate(cells) if len(cells) > 1 else cells[0]
+        return indexes, haversine_np(lat, lon, self.lats[indexes], self.lons[indexes])
+
+    def query_radius(self, lat, lon, radius_km, type_filter=None):
+        """
+        Zwraca (indeksy koszy, odległości w km) dla koszy w promieniu radius_km,
+        w kolejności indeksów.
+        """
+        grid, _ = self._category_grid(type_filter)
+        indexes, distances = self._distances(lat, lon, list(self._cells_in_radius(grid, lat, lon, radius_km)))
+        inside = distances <= radius_km
+        indexes, distances = indexes[inside], distances[inside]
+        order = np.argsort(indexes, kind="stable")
+        return indexes[order], distances[order]
+
+    def _ring_gap_km(self, lat, lon, row0, col0, ring):
+        """ Dolne ograniczenie odległości do koszy spoza pierścieni 0..ring """
+        cs = self.cell_size
+        min_cos = min(self._min_cos, math.cos(math.radians(lat)))
+        gap_lat = min(lat - (row0 - ring) * cs, (row0 + ring + 1) * cs - lat)
+        gap_lon = min(lon - (col0 - ring) * cs, (col0 + ring + 1) * cs - lon)
+        bound_lat = EARTH_RADIUS_KM * math.radians(gap_lat)
+        bound_lon = 2 * EARTH_RADIUS_KM * math.asin(
+            min(1.0, min_cos * math.sin(math.radians(gap_lon) / 2))
+        )
+        return min(bound_lat, bound_lon)
+
+    @staticmethod
+    def _ring_cells(row0, col0, ring, extent):
+        """ Komórki na obwodzie kwadratu o promieniu ring, przycięte do zasięgu siatki """
+        row_min, row_max, col_min, col_max = extent
+        if ring == 0:
+            yield row0, col0
+            return
+        for row in (row0 - ring, row0 + ring):
+            if row_min <= row <= row_max:
+                for col in range(max(col0 - ring, col_min), min(col0 + ring, col_max) + 1):
+                    yield row, col
+        for col in (col0 - ring, col0 + ring):
+            if col_min <= col <= col_max:
+                for row in range(max(row0 - ring + 1, row_min), min(row0 + ring - 1, row_max) + 1):
+                    yield row, col
+
+    def nearest(self, lat, lon, k=1, type_filter=None, max_distance_km=None):
+        """
+        Zwraca (indeksy, odległości w km) k najbliższych koszy, posortowane po
+        odległości po kole wielkim. Komórki są przeglądane pierścieniami od
+        komórki użytkownika, dopóki bliższy kosz jest możliwy.
+        """
+        grid, extent = self._category_grid(type_filter)
+        best_indexes, best_distances = _EMPTY, np.empty(0)
+        if not grid or k <= 0:
+            return best_indexes, best_distances
+
+        row0, col0 = self._cell(lat, lon)
+        first_ring = max(0, extent[0] - row0, row0 - extent[1], extent[2] - col0, col0 - extent[3])
+        last_ring = max(row0 - extent[0], extent[1] - row0, col0 - extent[2], extent[3] - col0)
+
+        for ring in range(first_ring, last_ring + 1):
+            cells = [grid[cell] for cell in self._ring_cells(row0, col0, ring, extent) if cell in grid]
+            if cells:
+                indexes, distances = self._distances(lat, lon, cells)
+                if max_distance_km is not None:
+                    inside = distances <= max_distance_km
+                    indexes, distances = indexes[inside], distances[inside]
+                best_indexes = np.concatenate([best_indexes, indexes])
+                best_distances = np.concatenate([best_distances, distances])
+                if len(best_distances) > k:
+                    keep = np.argpartition(best_distances, k - 1)[:k]
+                    best_indexes, best_distances = best_indexes[keep], best_distances[keep]
+
+            gap = self._ring_gap_km(lat, lon, row0, col0, ring)
+            if max_distance_km is not None and gap > max_distance_km:
+                break
+            if len(best_distances) == k and gap >= best_distances.max():
+                break
+
+        order = np.lexsort((best_indexes, best_distances))
+        return best_indexes[order], best_distances[order]
+
+    def coverage(self, user_lats, user_lons, radius_km=1, type_filter=None):
+        """
+        Jak distance.coverage, ale przez siatkę: dla każdej lokalizacji
+        odległość do najbliższego kosza (nearest) i liczba koszy w promieniu
+        (query_radius), bez macierzy M x N.
+        """
+        nearest = np.full(len(user_lats), np.inf)
+        counts = np.zeros(len(user_lats), dtype=np.int64)
+        for i, (lat, lon) in enumerate(zip(np.asarray(user_lats).tolist(), np.asarray(user_lons).tolist())):
+            _, distances = self.nearest(lat, lon, 1, type_filter)
+            if len(distances):
+                nearest[i] = distances[0]
+            counts[i] = len(self.query_radius(lat, lon, radius_km, type_filter)[0])
+        return nearest, counts
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def load_bin_store(path=SNAPSHOT_FILE):
+    """
+    Indeks koszy ze zrzutu path. Gotowy indeks obok zrzutu (index_path) ma
+    pierwszeństwo, chyba że zrzut jest od niego nowszy; sam indeks bez
+    zrzutu też wystarcza.
+    """
+    prebuilt = index_path(path)
+    try:
+        prebuilt_mtime = os.stat(prebuilt).st_mtime_ns
+    except FileNotFoundError:
+        return BinStore.from_file(path)
+    try:
+        if os.stat(path).st_mtime_ns > prebuilt_mtime:
+            return BinStore.from_file(path)
+    except FileNotFoundError:
+        pass
+    return BinStore.from_index(prebuilt)
+
+
+def get_bin_store(path=SNAPSHOT_FILE):
+    """ Zwraca współdzielony indeks koszy, wczytując go przy pierwszym użyciu """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = load_bin_store(path)
+    return _store
+
+
+def set_bin_store(store):
+    """
+    Podmienia współdzielony indeks. Czytelnicy, którzy już pobrali stary
+    indeks, kończą na nim zapytanie - nikt nie widzi indeksu w połowie budowy.
+    """
+    global _store
+    with _store_lock:
+        _store = store
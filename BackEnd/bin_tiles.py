@@ -0,0 +1,189 @@
+import gzip
+import hashlib
+import json
+import math
+import threading
+import weakref
+
+import numpy as np
+
+from bin_store import bin_type, matches_type
+
+# Kafelki slippy map na jednym poziomie: przy z=15 bok ma ok. 1.2 km (0.8 km W-E w Krakowie)
+TILE_ZOOM = 15
+TILE_FORMATS = ("json", "delta")
+# Współrzędne w formacie delta to liczby całkowite w milionowych częściach stopnia (~0.1 m)
+COORD_SCALE = 1_000_000
+
+
+def tile_xy(lats, lons, zoom=TILE_ZOOM):
+    """ Numery kafelków (x, y) slippy map dla tablic współrzędnych """
+    n = 2 ** zoom
+    lat_rad = np.radians(lats)
+    xs = np.floor((np.asarray(lons) + 180.0) / 360.0 * n).astype(np.int64)
+    ys = np.floor((1.0 - np.arcsinh(np.tan(lat_rad)) / math.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(xs, 0, n - 1), np.clip(ys, 0, n - 1)
+
+
+def tile_bbox(x, y, zoom=TILE_ZOOM):
+    """ Zasięg kafelka (x, y) jako (south, west, north, east) """
+    n = 2 ** zoom
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def _etag(body):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class Tile:
+    """ Gotowa odpowiedź kafelka: treść, wersja gzip i silne ETagi dla obu """
+
+    __slots__ = ("body", "etag", "gzip_body", "gzip_etag")
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, separators=(",", ":")).encode()
+        self.etag = _etag(self.body)
+        # mtime=0 - ta sama treść daje zawsze te same bajty
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.gzip_etag = self.etag[:-1] + '-gz"'
+
+
+def _encode(fmt, header, lats, lons, types):
+    if fmt == "json":
+        return {**header, "bins": [[lat, lon, type_] for lat, lon, type_ in zip(lats, lons, types)]}
+
+    # delta: kosze posortowane po szerokości, współrzędne jako różnice kolejnych liczb całkowitych
+    order = np.lexsort((lons, lats))
+    lat_int = np.round(np.asarray(lats)[order] * COORD_SCALE).astype(np.int64)
+    lon_int = np.round(np.asarray(lons)[order] * COORD_SCALE).astype(np.int64)
+    names = sorted(set(types))
+    codes = {name: i for i, name in enumerate(names)}
+    return {
+        **header,
+        "scale": COORD_SCALE,
+        "types": names,
+        "lat": np.diff(lat_int, prepend=0).tolist(),
+        "lon": np.diff(lon_int, prepend=0).tolist(),
+        "type": [codes[types[i]] for i in order.tolist()],
+    }
+
+
+class BinTiles:
+    """
+    Odpowiedzi /bins/tiles dla jednego indeksu koszy. Kafelki danej
+    kategorii i formatu są serializowane i kompresowane raz, przy pierwszym
+    zapytaniu o tę kategorię; potem odpowiedź to tylko odczyt ze słownika.
+    """
+
+    def __init__(self, store, zoom=TILE_ZOOM):
+        # Słaba referencja - kafelki w get_bin_tiles nie mogą trzymać przy życiu zwolnionego indeksu
+        self._store = weakref.ref(store)
+        self.zoom = zoom
+        self._xs, self._ys = tile_xy(store.lats, store.lons, zoom)
+        self._tiles = {}  # (kategoria, format) -> {(x, y): Tile}
+        self._empty = {}
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        return self._store()
+
+    def _key(self, category, fmt):
+        # Tak jak w BinStore: nieznana kategoria to tylko zwykłe kosze
+        if category is not None and category not in self.store.categories:
+            category = ""
+        return category, fmt
+
+    def is_built(self, category, fmt="json"):
+        return self._key(category, fmt) in self._tiles
+
+    def _build(self, category, fmt):
+        store = self.store
+        mask = store.type_mask(category)
+        indexes = np.flatnonzero(mask)
+        buckets = {}
+        for index, x, y in zip(indexes.tolist(), self._xs[indexes].tolist(), self._ys[indexes].tolist()):
+            buckets.setdefault((x, y), []).append(index)
+
+        tiles = {}
+        for (x, y), members in buckets.items():
+            header = {"z": self.zoom, "x": x, "y": y, "category": category}
+            tiles[(x, y)] = Tile(_encode(
+                fmt, header,
+                store.lats[members].tolist(),
+                store.lons[members].tolist(),
+                [bin_type(store.tags[i], category) for i in members],
+            ))
+        return tiles
+
+    def bins_in_tile(self, category, x, y):
+        """ Szerokości, długości i typy koszy kategorii w kafelku (x, y), bez budowania kafelków """
+        category = self._key(category, None)[0]
+        store = self.store
+        members = [
+            index for index in np.flatnonzero((self._xs == x) & (self._ys == y)).tolist()
+            if matches_type(store.tags[index], category)
+        ]
+        return (
+            store.lats[members].tolist(),
+            store.lons[members].tolist(),
+            [bin_type(store.tags[i], category) for i in members],
+        )
+
+    def tile(self, category, x, y, fmt="json"):
+        """ Kafelek (x, y) dla kategorii - pusty, gdy nie ma w nim koszy """
+        key = self._key(category, fmt)
+        tiles = self._tiles.get(key)
+        if tiles is None:
+            with self._lock:
+                tiles = self._tiles.get(key)
+                if tiles is None:
+                    tiles = self._tiles[key] = self._build(key[0], fmt)
+        tile = tiles.get((x, y))
+        if tile is None:
+            header = {"z": self.zoom, "x": x, "y": y, "category": key[0]}
+            tile = Tile(_encode(fmt, header, [], [], []))
+        return tile
+
+
+def merged_tile(tiles, category, x, y, fmt="json", zoom=TILE_ZOOM):
+    """
+    Kafelek na granicy regionów, złożony z koszy kilku indeksów. Takich
+    kafelków jest niewiele, więc nie są trzymane - składane są przy zapytaniu.
+    """
+    lats, lons, types = [], [], []
+    for tiles_ in tiles:
+        tile_lats, tile_lons, tile_types = tiles_.bins_in_tile(category, x, y)
+        lats += tile_lats
+        lons += tile_lons
+        types += tile_types
+    header = {"z": zoom, "x": x, "y": y, "category": category}
+    return Tile(_encode(fmt, header, lats, lons, types))
+
+
+# Kafelki dla każdego żywego indeksu - znikają razem z indeksem (podmiana, zwolnienie regionu)
+_tiles = weakref.WeakKeyDictionary()
+_tiles_lock = threading.Lock()
+
+
+def get_bin_tiles(store):
+    """ Kafelki dla podanego indeksu; po podmianie indeksu budowane od nowa """
+    tiles = _tiles.get(store)
+    if tiles is None:
+        with _tiles_lock:
+            tiles = _tiles.get(store)
+            if tiles is None:
+                tiles = _tiles[store] = BinTiles(store)
+    return tiles
+
+
+def etag_matches(if_none_match, etag):
+    """ Czy nagłówek If-None-Match obejmuje etag """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
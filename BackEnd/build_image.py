@@ -0,0 +1,68 @@
+import argparse
+import os
+import sqlite3
+import time
+
+import migrations
+from bin_store import BinStore, index_path
+from db import DB_FILE
+from regions import REGIONS, region_snapshot_path
+
+DB_IMAGE_FILE = "waste.image.db"
+
+
+def build_db_image(source=DB_FILE, target=DB_IMAGE_FILE):
+    """
+    Kopia bazy dla replik tylko do odczytu (db.DB_IMAGE): spakowana przez
+    VACUUM INTO, po wszystkich migracjach i ANALYZE, w trybie dziennika
+    DELETE, żeby dało się ją otworzyć jako immutable. Plik docelowy jest
+    podmieniany atomowo - działające repliki zostają przy starym.
+    """
+    tmp_path = f"{target}.tmp"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    conn = sqlite3.connect(source)
+    try:
+        conn.execute("VACUUM INTO ?", (tmp_path,))
+    finally:
+        conn.close()
+
+    image = sqlite3.connect(tmp_path)
+    try:
+        migrations.migrate(image)
+        image.execute("ANALYZE")
+        image.execute("PRAGMA journal_mode=DELETE")
+        image.commit()
+    finally:
+        image.close()
+    os.replace(tmp_path, target)
+    return os.path.getsize(target)
+
+
+def build_bin_indexes(paths):
+    """ Gotowe indeksy koszy (BinStore.save_index) obok każdego istniejącego zrzutu; zwraca [(zrzut, liczba koszy)] """
+    built = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        store = BinStore.from_file(path)
+        store.save_index(index_path(path))
+        built.append((path, len(store)))
+    return built
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gotowy obraz bazy i indeksy koszy dla nowych replik API")
+    parser.add_argument("--db", default=DB_FILE, help="baza źródłowa")
+    parser.add_argument("--image", default=DB_IMAGE_FILE, help="plik obrazu bazy")
+    parser.add_argument("--snapshot", action="append", default=None,
+                        help="zrzut koszy do zindeksowania (domyślnie zrzuty wszystkich regionów)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    size = build_db_image(args.db, args.image)
+    print(f"{args.image}: {size / 2**20:.1f} MB ({time.perf_counter() - start:.1f} s)")
+
+    snapshots = args.snapshot or [region_snapshot_path(name) for name in REGIONS]
+    for path, bins in build_bin_indexes(snapshots):
+        print(f"{index_path(path)}: {bins} koszy")
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Ograniczony cache LRU z czasem życia wpisów (TTL). Bezpieczny dla wielu
+    wątków; liczniki trafień, chybień i usunięć pozwalają dobrać rozmiar.
+
+    Każde unieważnienie podbija generation. Kto wypełnia cache wynikiem
+    zapytania, odczytuje generation przed zapytaniem i przekazuje ją do put -
+    gdy w międzyczasie coś unieważniono, wynik mógł być sprzed zmiany i nie
+    trafia do cache. Generacja jest wspólna dla wszystkich kluczy (bez
+    pamiętania usuniętych kluczy), więc unieważnienie odrzuca też trwające
+    wypełnienia innych kluczy - te po prostu nie są zapamiętane.
+    """
+
+    def __init__(self, maxsize=10_000, ttl=300.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()  # klucz -> (czas wygaśnięcia, wartość)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_puts = 0
+        self.generation = 0
+
+    def get(self, key):
+        """ Zwraca wartość albo None, gdy jej brak lub wygasła """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        """ Zapisuje wartość; z generation odczytaną przed zapytaniem pomija nieaktualny wynik i zwraca False """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                self.stale_puts += 1
+                return False
+            self._data[key] = (self._clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self.generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale_puts": self.stale_puts,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,13 +1,24 @@
-import math
+from bin_store import BIN_COLUMNS, bin_type
+from metrics import span
+from regions import get_region_index
 
-from fetch_waste_bins import fetch_waste_bins
 
-def closest_bin(x_user, y_user, type_user):
-    bins = fetch_waste_bins(type_user)
+def closest_bin(lat_user, lon_user, type_user=None, k=1, max_distance=None, columns=False):
+    """
+    Zwraca k najbliższych koszy danego typu jako listę [lat, lon, typ, odległość w km],
+    posortowaną rosnąco po odległości. max_distance (km) ogranicza promień wyszukiwania.
+    Przy granicy regionów brane są pod uwagę kosze z każdego z nich.
+    columns=True zwraca zamiast tego słownik kolumn (BIN_COLUMNS).
+    """
+    with span("closest_bin_query"):
+        best = get_region_index().nearest(lat_user, lon_user, k=k, type_filter=type_user, max_distance_km=max_distance)
+    if best is None:
+        return {"error": "Failed to fetch data"}
 
-    def distance(x1, y1, x2, y2):
-        return math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
-
-    closest = min(bins, key=lambda bin: distance(x_user, y_user, bin[0], bin[1]), default=None)
-
-    return closest
\ No newline at end of file
+    rows = [
+        [float(store.lats[index]), float(store.lons[index]), bin_type(store.tags[index], type_user), round(distance, 3)]
+        for distance, store, index in best
+    ]
+    if columns:
+        return {name: [row[i] for row in rows] for i, name in enumerate(BIN_COLUMNS)}
+    return rows
@@ -6,51 +6,81 @@ import time
 import logging
 from typing import List, Dict, Optional, Union
 
+import metrics
+from off_cache import OFFResponseCache, get_off_cache, stats_delta
+from singleflight import SingleFlight
+
 # Konfiguracja logowania
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+OFF_API_URL = "https://world.openfoodfacts.org/api/v2/product"
+OFF_FIELDS = "code,_id,product_name,product_name_en,categories_hierarchy,packaging_materials_tags,packagings,packaging,ecoscore_score,ecoscore_data,selected_images,image_front_url,image_url"
+OFF_HEADERS = {'User-Agent': 'MyDataExtractorApp/1.0 (your.email@example.com)'} # WAŻNE: Zmień na swoje dane!
+
+# Równoległe zapytania o ten sam kod (z różnych wątków) idą do API raz
+off_flight = SingleFlight()
+
 # --- Funkcja do pobierania danych z API dla jednego kodu ---
-def fetch_product_data_from_api(barcode: str) -> Optional[Dict]:
+def fetch_product_data_from_api(barcode: str, api_url: str = OFF_API_URL, cache: Optional[OFFResponseCache] = None) -> Optional[Dict]:
     """
     Pobiera dane produktu z API Open Food Facts dla danego kodu kreskowego (v2 API).
+    Odpowiedzi (także brak produktu) są zapamiętywane w trwałym cache.
 
     Args:
         barcode (str): Kod kreskowy produktu.
+        api_url (str): Adres bazowy API produktów (np. lokalny serwer testowy).
+        cache (OFFResponseCache): Cache odpowiedzi; domyślnie wspólny get_off_cache().
 
     Returns:
         Słownik z danymi produktu ('product') lub None w przypadku błędu/braku produktu.
     """
-    api_url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
-    fields = "code,_id,product_name,product_name_en,categories_hierarchy,packaging_materials_tags,packagings,packaging,ecoscore_score,ecoscore_data,selected_images,image_front_url,image_url"
-    api_url_with_fields = f"{api_url}?fields={fields}"
+    cache = cache or get_off_cache()
+    hit, cached_product = cache.get(barcode, OFF_FIELDS)
+    if hit:
+        return cached_product
+
+    return off_flight.do((api_url, barcode), lambda: _request_product(barcode, api_url, cache))
+
+
+def _request_product(barcode: str, api_url: str, cache: OFFResponseCache) -> Optional[Dict]:
+    """ Zapytanie do API dla fetch_product_data_from_api; wynik trafia do cache """
+    api_url_with_fields = f"{api_url}/{barcode}.json?fields={OFF_FIELDS}"
 
     logging.info(f"Wysyłanie zapytania do API dla kodu: {barcode}")
-    headers = {'User-Agent': 'MyDataExtractorApp/1.0 (your.email@example.com)'} # WAŻNE: Zmień na swoje dane!
 
     try:
-        response = requests.get(api_url_with_fields, headers=headers, timeout=20)
+        with metrics.span("off_request"):
+            response = requests.get(api_url_with_fields, headers=OFF_HEADERS, timeout=20)
         response.raise_for_status()
-        data = response.json()
+        with metrics.span("off_json_decode"):
+            data = response.json()
         if "product" in data and data.get("product"):
             logging.info(f"Pomyślnie pobrano dane dla {barcode}.")
+            cache.put(barcode, OFF_FIELDS, data.get("product"))
             return data.get("product")
         else:
             logging.warning(f"Produkt o kodzie {barcode} nie został znaleziony lub brak danych w odpowiedzi.")
+            cache.put(barcode, OFF_FIELDS, None)
             return None
     except requests.exceptions.HTTPError as http_err:
         if response.status_code == 404:
             logging.warning(f"Nie znaleziono produktu o kodzie: {barcode} (404 Not Found).")
+            cache.put(barcode, OFF_FIELDS, None)
         else:
             logging.error(f"Błąd HTTP podczas zapytania do API dla {barcode}: {http_err}")
+            metrics.upstream_errors.inc("off", f"HTTP {response.status_code}")
         return None
     except requests.exceptions.Timeout:
         logging.error(f"Przekroczono czas oczekiwania na odpowiedź API dla {barcode}.")
+        metrics.upstream_errors.inc("off", "timeout")
         return None
     except requests.exceptions.RequestException as req_err:
         logging.error(f"Błąd połączenia lub zapytania do API dla {barcode}: {req_err}")
+        metrics.upstream_errors.inc("off", type(req_err).__name__)
         return None
     except json.JSONDecodeError:
         logging.error(f"Błąd dekodowania odpowiedzi JSON z API dla {barcode}.")
+        metrics.upstream_errors.inc("off", "JSONDecodeError")
         return None
     except Exception as e:
         logging.error(f"Nieoczekiwany błąd podczas pobierania danych dla {barcode}: {e}")
@@ -163,6 +193,16 @@ def extract_product_info(product: Dict) -> Optional[Dict]:
         "image_url": image_link
     }
 
+# --- Rekord w formacie oczekiwanym przez init_db ---
+def to_db_record(info: Dict) -> Dict:
+    """
+    Zamienia wynik extract_product_info na rekord dla init_db
+    (materiał opakowania pod kluczem 'packaging_material').
+    """
+    record = dict(info)
+    record["packaging_material"] = record.pop("type_recycle", None)
+    return record
+
 # --- Główna funkcja przetwarzająca Z LIMITEREM ---
 def process_barcodes_from_file(barcodes_file: str, output_file: str = "api_processed_products.json", record_limit: int = 100) -> None: # Dodano record_limit
     """
@@ -195,11 +235,14 @@ def process_barcodes_from_file(barcodes_file: str, output_file: str = "api_proce
     total_to_process = len(barcodes_to_process)
 
     print(f"Rozpoczynanie pobierania danych dla {total_to_process} kodów (limit: {record_limit})...")
+    cache = get_off_cache()
+    cache_before = cache.stats()
 
     # Zmieniono pętlę, aby iterowała tylko po ograniczonej liście
     for i, barcode in enumerate(barcodes_to_process):
-        # 1. Pobierz dane z API
-        product_data_from_api = fetch_product_data_from_api(barcode)
+        # 1. Pobierz dane z API (lub z cache)
+        misses = cache.misses
+        product_data_from_api = fetch_product_data_from_api(barcode, cache=cache)
 
         if product_data_from_api:
             # 2. Wyekstrahuj potrzebne informacje
@@ -219,8 +262,15 @@ def process_barcodes_from_file(barcodes_file: str, output_file: str = "api_proce
              progress = ((i + 1) / total_to_process) * 100
              logging.info(f"Postęp: {i + 1}/{total_to_process} ({progress:.1f}%)")
 
-        # 3. Dodaj opóźnienie między zapytaniami
-        time.sleep(0.5)
+        # 3. Dodaj opóźnienie między zapytaniami (tylko gdy faktycznie odpytano API)
+        if cache.misses > misses:
+            time.sleep(0.5)
+
+    cache_stats = stats_delta(cache_before, cache.stats())
+    logging.info(
+        f"Cache OFF: trafienia {cache_stats['hits']}, zapamiętane braki {cache_stats['negative_hits']}, "
+        f"chybienia {cache_stats['misses']} ({cache_stats['hit_ratio']:.1%})"
+    )
 
     # Zapisz wyniki do pliku
     try:
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+import metrics
+
+DB_FILE = "waste.db"
+# Gotowy obraz bazy tylko do odczytu (build_image.py). Gdy ustawiony, API
+# czyta z niego i niczego nie zapisuje - nowa replika nie migruje ani nie importuje
+DB_IMAGE = os.environ.get("DB_IMAGE")
+
+# Ustawienia każdego połączenia: WAL pozwala czytać równolegle z zapisem,
+# synchronous=NORMAL w trybie WAL nie robi fsync przy każdym commicie.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-32000",      # ~32 MB
+    "PRAGMA mmap_size=268435456",    # 256 MB
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Obraz nie ma WAL ani zapisów - tylko ustawienia odczytu
+READ_ONLY_PRAGMAS = (
+    "PRAGMA cache_size=-32000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Liczba skompilowanych zapytań trzymanych przez każde połączenie
+STATEMENT_CACHE_SIZE = 256
+
+
+class ConnectionPool:
+    """
+    Jedno długo żyjące połączenie na wątek. Połączenie nie jest
+    współdzielone między wątkami, więc nie potrzebuje blokad, a sqlite3
+    ponownie używa skompilowanych zapytań dla identycznego tekstu SQL.
+
+    read_only=True otwiera plik jako niezmienny obraz (immutable=1): SQLite
+    nie zakłada blokad i nie sprawdza, czy ktoś zmienił plik, więc obrazu
+    nie wolno modyfikować w miejscu - nowa wersja to nowy plik.
+    """
+
+    def __init__(self, db_file=DB_FILE, read_only=False):
+        self.db_file = db_file
+        self.read_only = read_only
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with metrics.span("db_connect"):
+            if self.read_only:
+                uri = f"file:{quote(os.path.abspath(self.db_file))}?mode=ro&immutable=1"
+                conn = sqlite3.connect(
+                    uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE
+                )
+                pragmas = READ_ONLY_PRAGMAS
+            else:
+                conn = sqlite3.connect(
+                    self.db_file,
+                    check_same_thread=False,
+                    cached_statements=STATEMENT_CACHE_SIZE,
+                )
+                pragmas = PRAGMAS
+            for pragma in pragmas:
+                conn.execute(pragma)
+        return conn
+
+    def connection(self):
+        """ Zwraca połączenie przypisane do bieżącego wątku """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+pool = ConnectionPool(DB_IMAGE or DB_FILE, read_only=DB_IMAGE is not None)
+
+
+def get_connection():
+    """ Połączenie z bazą dla bieżącego wątku """
+    return pool.connection()
@@ -0,0 +1,61 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Oblicza odległość w kilometrach między dwoma punktami na Ziemi."""
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_np(lat, lon, lats, lons):
+    """
+    Odległości w km od punktu (lat, lon) do tablicy punktów (lats, lons).
+    Argumenty są rozgłaszane (broadcasting) jak w NumPy, więc lat/lon mogą
+    też być tablicami.
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    lats = np.radians(lats)
+    lons = np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(user_lats, user_lons, bin_lats, bin_lons):
+    """ Macierz M x N odległości w km między M lokalizacjami użytkowników a N koszami """
+    user_lats = np.asarray(user_lats, dtype=np.float64)[:, np.newaxis]
+    user_lons = np.asarray(user_lons, dtype=np.float64)[:, np.newaxis]
+    return haversine_np(user_lats, user_lons, np.asarray(bin_lats), np.asarray(bin_lons))
+
+
+def coverage(user_lats, user_lons, bin_lats, bin_lons, radius_km=1, max_elements=1 << 21):
+    """
+    Mapa pokrycia dla M lokalizacji: odległość do najbliższego kosza i liczba
+    koszy w promieniu radius_km. Macierz liczona jest w kawałkach wierszy
+    po najwyżej max_elements odległości (haversine_np tworzy kilka tablic
+    pośrednich tego rozmiaru), więc pamięć zależy od max_elements, a nie od
+    M x N. Czas nadal rośnie z M x N - dla zrzutu z indeksem szybsze jest
+    BinStore.coverage.
+    """
+    user_lats = np.asarray(user_lats, dtype=np.float64)
+    user_lons = np.asarray(user_lons, dtype=np.float64)
+    nearest = np.full(len(user_lats), np.inf)
+    counts = np.zeros(len(user_lats), dtype=np.int64)
+    if len(bin_lats) == 0:
+        return nearest, counts
+
+    rows = max(1, max_elements // len(bin_lats))
+    for start in range(0, len(user_lats), rows):
+        end = start + rows
+        distances = haversine_matrix(user_lats[start:end], user_lons[start:end], bin_lats, bin_lons)
+        nearest[start:end] = distances.min(axis=1)
+        counts[start:end] = (distances <= radius_km).sum(axis=1)
+    return nearest, counts
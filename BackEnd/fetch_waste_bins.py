@@ -1,82 +1,147 @@
-import requests
 import json
-import math
-
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Oblicza odległość w kilometrach między dwoma punktami na Ziemi."""
-    R = 6371  # Promień Ziemi w km
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
-def fetch_waste_bins(lat: float, lon: float, type_filter=None):
-    overpass_url = "https://overpass-api.de/api/interpreter"
-
-    if type_filter is None:
-        query = """
-        [out:json][timeout:25];
-        area["name"="Kraków"]["admin_level"="8"]->.krakow;
-        (
-            node["amenity"="waste_basket"](area.krakow);
-            node["recycling_type"="container"](area.krakow);
-            node["recycling:paper"="yes"](area.krakow);
-            node["recycling:glass"="yes"](area.krakow);
-            node["recycling:plastic"="yes"](area.krakow);
-            node["recycling:metal"="yes"](area.krakow);
-            node["recycling:organic"="yes"](area.krakow);
-            node["recycling:glass_bottles"="*"](area.krakow);
-            node["recycling:plastic_bottles"="*"](area.krakow);
-        );
-        out body;
-        """
-    else:
-        query = f"""
-        [out:json][timeout:25];
-        area["name"="Kraków"]["admin_level"="8"]->.krakow;
-        (
-          node["amenity"="waste_basket"](area.krakow);
-          node["recycling:{type_filter}"="yes"](area.krakow);
-        );
-        out body;
-        """
-
-    response = requests.get(overpass_url, params={'data': query})
-
-    if response.status_code != 200:
-        return {"error": "Failed to fetch data"}
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from bin_store import BIN_COLUMNS, SNAPSHOT_FILE, BinStore, bin_type, index_path
+from metrics import span
+from regions import DEFAULT_REGION, REGIONS, get_region_index, region_snapshot_path
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+SEARCH_RADIUS_KM = 1
+
+
+def snapshot_query(region=REGIONS[DEFAULT_REGION]):
+    """ Zapytanie o wszystkie kosze w obszarze regionu - filtrowanie po typie odbywa się lokalnie """
+    area = f'area["name"="{region.area}"]["admin_level"="{region.admin_level}"]->.region;'
+    return f"""
+[out:json][timeout:25];
+{area}
+(
+    node["amenity"="waste_basket"](area.region);
+    node["amenity"="recycling"](area.region);
+    node["recycling_type"="container"](area.region);
+    node[~"^recycling:"~"^yes$"](area.region);
+    node["recycling:glass_bottles"="*"](area.region);
+    node["recycling:plastic_bottles"="*"](area.region);
+);
+out meta;
+"""
+
+
+SNAPSHOT_QUERY = snapshot_query()
+
+
+def fetch_snapshot(source=OVERPASS_URL, query=SNAPSHOT_QUERY):
+    """
+    Pobiera zrzut wszystkich koszy. source to adres serwera Overpass
+    (http/https) albo ścieżka do pliku z zapisaną odpowiedzią.
+    """
+    if source.startswith(("http://", "https://")):
+        # requests tylko dla pobierania synchronicznego (CLI, odświeżanie) - API
+        # używa httpx, więc import nie wydłuża startu serwera
+        import requests
 
-    data = response.json()
-    results = []
+        with span("overpass_request"):
+            response = requests.get(source, params={'data': query}, timeout=60)
+            response.raise_for_status()
+        with span("overpass_json_decode"):
+            return response.json()
 
-    for element in data.get("elements", []):
-        bin_lat = element.get("lat")
-        bin_lon = element.get("lon")
-        tags = element.get("tags", {})
+    with open(source, "r", encoding="utf-8") as f, span("snapshot_json_decode"):
+        return json.load(f)
 
-        # Obliczamy odległość od podanej lokalizacji
-        distance = haversine_distance(lat, lon, bin_lat, bin_lon)
 
-        # Filtrujemy tylko te kosze, które są w odległości <= 1 km
-        if distance <= 1:
-            if "amenity" in tags and tags["amenity"] == "waste_basket":
-                type_ = "waste_basket"
-            elif f"recycling:{type_filter}" in tags:
-                type_ = f"{type_filter}"
-            else:
-                type_ = "unknown"
+async def fetch_snapshot_async(client, source=OVERPASS_URL, query=SNAPSHOT_QUERY):
+    """ Jak fetch_snapshot dla adresu Overpass, ale przez współdzielony httpx.AsyncClient """
+    with span("overpass_request"):
+        response = await client.get(source, params={'data': query})
+        response.raise_for_status()
+    with span("overpass_json_decode"):
+        return response.json()
 
-            results.append([bin_lat, bin_lon, type_, round(distance, 3)])
 
-    with open("waste_bins.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2)
+def install_snapshot(data, path=SNAPSHOT_FILE):
+    """ Buduje indeks ze zrzutu, zapisuje zrzut na dysk i podmienia indeks w pamięci """
+    with span("bins_index_build"):
+        store = BinStore(data.get("elements", []))
+    write_snapshot(data, path)
+    store.save_index(index_path(path))
+    get_region_index().set_store(DEFAULT_REGION, store)
+    return store
 
-    return results
+
+def write_snapshot(data, path=SNAPSHOT_FILE):
+    """ Zapisuje zrzut do pliku tymczasowego i podmienia go, żeby nikt nie przeczytał połowy pliku """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".waste_bins_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f, span("snapshot_write"):
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def download_snapshot(path=SNAPSHOT_FILE, source=OVERPASS_URL, query=SNAPSHOT_QUERY):
+    """ Pobiera z Overpass zrzut wszystkich koszy i zapisuje go do pliku """
+    data = fetch_snapshot(source, query)
+    write_snapshot(data, path)
+    return len(data.get("elements", []))
+
+
+def fetch_waste_bins(lat: float, lon: float, type_filter=None, columns=False):
+    """
+    Kosze w promieniu SEARCH_RADIUS_KM jako lista wierszy [lat, lon, typ, odległość]
+    albo, gdy columns=True, słownik kolumn (BIN_COLUMNS) z tablicami NumPy.
+    """
+    # Przy granicy regionów wyniki z kilku indeksów są łączone
+    with span("bins_query"):
+        results = get_region_index().query_radius(lat, lon, SEARCH_RADIUS_KM, type_filter)
+    if results is None:
+        return {"error": "Failed to fetch data"}
+
+    with span("bins_serialize"):
+        if columns:
+            return _bins_columns(results, type_filter)
+        return [
+            [bin_lat, bin_lon, bin_type(store.tags[index], type_filter), distance]
+            for store, indexes, distances in results
+            for index, bin_lat, bin_lon, distance in zip(
+                indexes.tolist(),
+                store.lats[indexes].tolist(),
+                store.lons[indexes].tolist(),
+                np.round(distances, 3).tolist(),
+            )
+        ]
+
+
+def _bins_columns(results, type_filter):
+    # Współrzędne i odległości zostają tablicami - serializer zapisuje je bez list Pythona
+    if not results:
+        return {name: [] for name in BIN_COLUMNS}
+    lat, lon, type_, distance = BIN_COLUMNS
+    return {
+        lat: np.concatenate([store.lats[indexes] for store, indexes, _ in results]),
+        lon: np.concatenate([store.lons[indexes] for store, indexes, _ in results]),
+        type_: [
+            bin_type(store.tags[index], type_filter)
+            for store, indexes, _ in results for index in indexes.tolist()
+        ],
+        distance: np.round(np.concatenate([distances for _, _, distances in results]), 3),
+    }
 
 
 if __name__ == "__main__":
-    lat, lon = 50.06143, 19.93658  # Przykładowe współrzędne w Krakowie
+    region = REGIONS[sys.argv[1] if len(sys.argv) > 1 else DEFAULT_REGION]
+    path = region_snapshot_path(region.name)
+    if not os.path.exists(path):
+        print(f"Pobrano {download_snapshot(path, query=snapshot_query(region))} koszy do {path}")
+
+    south, west, north, east = region.bbox
+    lat, lon = (south + north) / 2, (west + east) / 2  # Przykładowe współrzędne w środku regionu
     bins = fetch_waste_bins(lat, lon, type_filter="glass")
     print(bins)
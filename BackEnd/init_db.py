@@ -1,83 +1,238 @@
-import sqlite3
+import argparse
+import gzip
 import json
+import re
+import sqlite3
+import time
+
+import migrations
 
 DB_FILE = "waste.db"
 DATA_FILE = "processed_products.json"
 
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS Types (
+    type_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type_name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS Types_recycle (
+    type_recycle_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type_name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS Product (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT,
+    type_recycle_id INTEGER DEFAULT NULL,
+    type_id INTEGER DEFAULT NULL,
+    barcode TEXT UNIQUE,
+    green_score TEXT DEFAULT NULL,
+    carbon_footprint FLOAT DEFAULT NULL,
+    number_of_verifications INTEGER DEFAULT 0,
+    image_url TEXT DEFAULT NULL,
+    FOREIGN KEY (type_recycle_id) REFERENCES Types_recycle(type_recycle_id),
+    FOREIGN KEY (type_id) REFERENCES Types(type_id)
+);
+'''
+
+# Ustawienia na czas importu: bez fsync i z dużym cache stron
+LOAD_PRAGMAS = (
+    "PRAGMA synchronous=OFF",
+    "PRAGMA cache_size=-262144",  # ~256 MB
+    "PRAGMA temp_store=MEMORY",
+)
+
+INSERT_PRODUCT = '''
+INSERT INTO Product (name, type_recycle_id, type_id, barcode, green_score, carbon_footprint, number_of_verifications, image_url)
+VALUES (?, ?, ?, ?, ?, ?, 0, ?)
+'''
+# Bez nadpisywania istniejących wierszy - ponowne uruchomienie wznawia import
+INSERT_PRODUCT_IGNORE = INSERT_PRODUCT + "ON CONFLICT(barcode) DO NOTHING"
+# Aktualizacja istniejących wierszy; liczba weryfikacji zostaje nietknięta
+INSERT_PRODUCT_UPSERT = INSERT_PRODUCT + '''ON CONFLICT(barcode) DO UPDATE SET
+    name = excluded.name,
+    type_recycle_id = excluded.type_recycle_id,
+    type_id = excluded.type_id,
+    green_score = excluded.green_score,
+    carbon_footprint = excluded.carbon_footprint,
+    image_url = excluded.image_url
+'''
+
+
+def create_schema(conn):
+    conn.executescript(SCHEMA)
+
+
+# Białe znaki i przecinki między elementami tablicy
+_ARRAY_SEPARATORS = re.compile(r"[\s,]*")
+_ARRAY_ITEM_END = (" ", "\t", "\n", "\r", ",", "]")
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def _iter_json_array(f, chunk_size=1 << 20):
+    """
+    Strumieniowo dekoduje elementy tablicy JSON bez wczytywania całego pliku.
+    Bufor nie jest kopiowany po każdym elemencie - dekodowanie idzie od
+    pozycji pos, a przeczytaną część obcina się dopiero przy doczytaniu.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Oczekiwano tablicy JSON")
+    pos = 1
+    eof = False
+
+    while True:
+        pos = _ARRAY_SEPARATORS.match(buffer, pos).end()
+        if pos < len(buffer):
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Element urwany na granicy kawałka - doczytaj więcej
+                if eof:
+                    raise
+            else:
+                # Bez separatora za elementem mógł on zostać urwany (np. liczba) - dekoduj po doczytaniu
+                if eof or buffer[end:end + 1] in _ARRAY_ITEM_END:
+                    yield item
+                    pos = end
+                    continue
+        elif eof:
+            raise ValueError("Niezakończona tablica JSON")
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+
+def iter_records(path):
+    """
+    Strumieniowo czyta produkty z pliku JSON (tablica) albo JSONL
+    (jeden obiekt na linię), również skompresowanego gzipem.
+    """
+    with _open_text(path) as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from _iter_json_array(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def _batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _resolve_names(cursor, table, id_column, names, cache):
+    """ Dodaje brakujące nazwy typów jednym executemany i uzupełnia cache nazwa -> id """
+    missing = sorted({name for name in names if name and name not in cache})
+    if not missing:
+        return
+    cursor.executemany(f"INSERT OR IGNORE INTO {table} (type_name) VALUES (?)", [(name,) for name in missing])
+    placeholders = ",".join("?" * len(missing))
+    cursor.execute(f"SELECT type_name, {id_column} FROM {table} WHERE type_name IN ({placeholders})", missing)
+    cache.update(cursor.fetchall())
+
+
+def bulk_import(path, db_file=DB_FILE, batch_size=50_000, upsert=False):
+    """
+    Wczytuje produkty do bazy partiami: executemany w dużych transakcjach,
+    indeksy pomocnicze zakładane po wczytaniu danych.
+
+    Args:
+        path: Plik JSON (tablica) lub JSONL, opcjonalnie .gz.
+        db_file: Plik bazy - nowy albo istniejący waste.db.
+        batch_size: Liczba produktów w jednej transakcji.
+        upsert: Nadpisuj istniejące produkty zamiast je pomijać.
+
+    Returns:
+        Liczba przetworzonych produktów.
+    """
+    conn = sqlite3.connect(db_file)
     cursor = conn.cursor()
-
-    # Tworzenie tabel
-    cursor.executescript('''
-    CREATE TABLE IF NOT EXISTS Types (
-        type_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        type_name TEXT NOT NULL UNIQUE
-    );
-
-    CREATE TABLE IF NOT EXISTS Types_recycle (
-        type_recycle_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        type_name TEXT NOT NULL UNIQUE
-    );
-
-    CREATE TABLE IF NOT EXISTS Product (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        type_recycle_id INTEGER DEFAULT NULL,
-        type_id INTEGER DEFAULT NULL,
-        barcode TEXT UNIQUE,
-        green_score TEXT DEFAULT NULL,
-        carbon_footprint FLOAT DEFAULT NULL,
-        number_of_verifications INTEGER DEFAULT 0,
-        image_url TEXT DEFAULT NULL,
-        FOREIGN KEY (type_recycle_id) REFERENCES Types_recycle(type_recycle_id),
-        FOREIGN KEY (type_id) REFERENCES Types(type_id)
-    );
-    ''')
-
-    # Wczytanie danych z JSON
-    with open(DATA_FILE, "r", encoding="utf-8") as file:
-        data = json.load(file)
-
-    # Zbiór unikalnych typów i materiałów opakowań
-    types_set = set()
-    packaging_materials_set = set()
-
-    # Iteracja po liście produktów
-    for item in data:
-        if item.get("type"):
-            types_set.add(item["type"])
-        if item.get("packaging_material"):
-            packaging_materials_set.add(item["packaging_material"])
-
-    # Dodanie unikalnych typów do tabeli Types
-    for type_name in types_set:
-        cursor.execute('INSERT OR IGNORE INTO Types (type_name) VALUES (?)', (type_name,))
-
-    # Dodanie unikalnych materiałów opakowań do tabeli Types_recycle
-    for material in packaging_materials_set:
-        cursor.execute('INSERT OR IGNORE INTO Types_recycle (type_name) VALUES (?)', (material,))
-
+    create_schema(conn)
+    for pragma in LOAD_PRAGMAS:
+        cursor.execute(pragma)
+    # Indeksy pomocnicze (migrations.INDEXES) zakładane są dopiero po wczytaniu danych
+    migrations.drop_indexes(conn)
+
+    types_dict = dict(cursor.execute("SELECT type_name, type_id FROM Types"))
+    types_recycle_dict = dict(cursor.execute("SELECT type_name, type_recycle_id FROM Types_recycle"))
+    insert_product = INSERT_PRODUCT_UPSERT if upsert else INSERT_PRODUCT_IGNORE
+
+    total = 0
+    start = time.perf_counter()
+    for batch in _batches(iter_records(path), batch_size):
+        cursor.execute("BEGIN")
+        _resolve_names(cursor, "Types", "type_id", (p.get("type") for p in batch), types_dict)
+        _resolve_names(
+            cursor, "Types_recycle", "type_recycle_id",
+            (p.get("packaging_material") for p in batch), types_recycle_dict,
+        )
+        cursor.executemany(insert_product, [
+            (
+                p.get("name"),
+                types_recycle_dict.get(p.get("packaging_material")),
+                types_dict.get(p.get("type")),
+                p.get("barcode"),
+                p.get("green_score"),
+                p.get("carbon_footprint"),
+                p.get("image_url"),
+            )
+            for p in batch
+        ])
+        cursor.execute("COMMIT")
+
+        total += len(batch)
+        elapsed = time.perf_counter() - start
+        print(f"Wczytano {total} produktów ({total / elapsed:.0f} wierszy/s)")
+
+    index_start = time.perf_counter()
+    migrations.create_indexes(conn)
     conn.commit()
+    migrations.migrate(conn)
+    cursor.execute("PRAGMA optimize")
+    conn.close()
 
-    # Pobranie ID typów
-    cursor.execute("SELECT type_id, type_name FROM Types")
-    types_dict = {row[1]: row[0] for row in cursor.fetchall()}
+    elapsed = time.perf_counter() - start
+    print(
+        f"Zakończono: {total} produktów w {elapsed:.1f} s ({total / elapsed if elapsed else 0:.0f} wierszy/s), "
+        f"indeksy {time.perf_counter() - index_start:.1f} s"
+    )
+    return total
 
-    cursor.execute("SELECT type_recycle_id, type_name FROM Types_recycle")
-    types_recycle_dict = {row[1]: row[0] for row in cursor.fetchall()}
 
-    # Dodanie produktów
-    for p in data:
-        type_id = types_dict.get(p.get("type"))
-        type_recycle_id = types_recycle_dict.get(p.get("packaging_material"))
+def init_db(data_file=DATA_FILE, db_file=DB_FILE):
+    """ Tworzy bazę i wczytuje do niej produkty z data_file """
+    return bulk_import(data_file, db_file)
 
-        cursor.execute('''
-        INSERT OR IGNORE INTO Product (name, type_recycle_id, type_id, barcode, green_score, carbon_footprint, number_of_verifications, image_url)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (p.get("name"), type_recycle_id, type_id, p.get("barcode"), p.get("green_score"), p.get("carbon_footprint"), 0, p.get("image_url")))
 
-    conn.commit()
-    conn.close()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import produktów do bazy SQLite")
+    parser.add_argument("path", nargs="?", default=DATA_FILE, help="plik JSON lub JSONL (.gz)")
+    parser.add_argument("--db", default=DB_FILE, help="plik bazy")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--upsert", action="store_true", help="nadpisuj istniejące produkty")
+    args = parser.parse_args()
 
-init_db()
+    bulk_import(args.path, args.db, args.batch_size, args.upsert)
@@ -0,0 +1,326 @@
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+
+# Przedziały histogramów czasu w sekundach - gęściej w okolicy pojedynczych milisekund
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Profilowanie pojedynczego zapytania nagłówkiem "X-Profile: <token>" (brak tokenu = wyłączone)
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILE_INTERVAL_S = float(os.environ.get("PROFILE_INTERVAL", 0.001))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """ Licznik z etykietami; wartości etykiet podawane pozycyjnie w kolejności labels """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield self.name + _format_labels(self.labels, labels), value
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start, *self._labels)
+        return False
+
+
+class Histogram:
+    """ Histogram w przedziałach buckets (sekundy), osobny dla każdego zestawu etykiet """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # etykiety -> [liczniki przedziałów..., suma, liczba]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *labels):
+        """ Kontekst mierzący czas bloku: with histogram.time("etykieta"): ... """
+        return _Timer(self, labels)
+
+    def count(self, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            return series[-1] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket" + _format_labels(self.labels, labels, le), cumulative
+            yield f"{self.name}_sum" + _format_labels(self.labels, labels), series[-2]
+            yield f"{self.name}_count" + _format_labels(self.labels, labels), series[-1]
+
+
+class _GaugeFunc:
+    """ Wartości liczone w chwili odczytu /metrics (np. statystyki cache) """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels, func):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._func = func
+
+    def samples(self):
+        for labels, value in self._func():
+            yield self.name + _format_labels(self.labels, labels), value
+
+
+class Registry:
+    """ Zbiór metryk procesu, wypisywany w formacie tekstowym Prometheus """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge_func(self, name, help, labels, func):
+        """ func() zwraca pary (wartości etykiet, wartość) """
+        with self._lock:
+            metric = self._metrics[name] = _GaugeFunc(name, help, labels, func)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{series} {_format_value(value)}" for series, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """ Zapis dla textfile collectora node_exportera (procesy wsadowe, np. scraper) """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "stage_duration_seconds", "Czas etapów na ścieżkach krytycznych (baza, Overpass, OFF, obliczenia)", ("stage",)
+)
+upstream_errors = registry.counter(
+    "upstream_errors_total", "Błędy zewnętrznych serwisów (Overpass, Open Food Facts)", ("upstream", "reason")
+)
+request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Czas obsługi zapytań HTTP", ("method", "route", "status")
+)
+
+# with span("etap"): ... - czas etapu trafia do stage_duration_seconds
+span = stage_seconds.time
+
+
+class SamplingProfiler:
+    """
+    Próbkujący profiler: co interval sekund zapisuje stosy wszystkich wątków
+    procesu (poza bezczynnymi). Wynik w formacie "collapsed stacks"
+    (flamegraph.pl, speedscope). Naraz działa najwyżej jeden profiler.
+    """
+
+    _running = threading.Lock()
+    _IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+    def __init__(self, interval=PROFILE_INTERVAL_S):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """ False, gdy inny profiler już działa """
+        if not self._running.acquire(blocking=False):
+            return False
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._running.release()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or frame.f_code.co_filename.endswith(self._IDLE_FILES):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            if self._stop.wait(self.interval):
+                return
+
+    def report(self, limit=200):
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common(limit)]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: czas każdego zapytania HTTP w http_request_duration_seconds
+    (etykieta route to szablon ścieżki, np. /product/{barcode}). Zapytanie z
+    nagłówkiem X-Profile równym PROFILE_TOKEN jest profilowane, a zamiast
+    odpowiedzi dostaje raport profilera.
+    """
+
+    def __init__(self, app, profile_token=PROFILE_TOKEN):
+        self.app = app
+        self.profile_token = profile_token
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self.profile_token and self._profile_requested(scope):
+            profiler = SamplingProfiler()
+            if profiler.start():
+                await self._profiled(profiler, scope, receive, send)
+                return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self._observe(scope, status, time.perf_counter() - start)
+
+    def _profile_requested(self, scope):
+        token = self.profile_token.encode()
+        return any(name == b"x-profile" and value == token for name, value in scope["headers"])
+
+    async def _profiled(self, profiler, scope, receive, send):
+        status = 500
+
+        async def discard(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+            elapsed = time.perf_counter() - start
+            self._observe(scope, status, elapsed)
+
+        body = profiler.report().encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"x-profiled-status", str(status).encode()),
+                (b"x-profile-samples", str(profiler.samples).encode()),
+                (b"x-profile-seconds", f"{elapsed:.6f}".encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    def _observe(scope, status, elapsed):
+        route = scope.get("route")
+        # Ścieżki bez trasy (404) pod jedną etykietą - inaczej każdy adres to nowa seria
+        path = getattr(route, "path", "unmatched")
+        request_seconds.observe(elapsed, scope["method"], path, str(status))
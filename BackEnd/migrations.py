@@ -0,0 +1,107 @@
+import argparse
+import sqlite3
+
+DB_FILE = "waste.db"
+
+# Indeksy pomocnicze w aktualnej postaci. init_db usuwa je na czas importu
+# i zakłada ponownie po wczytaniu danych.
+INDEXES = {
+    # Listy i statystyki po kategorii / materiale opakowania
+    "idx_product_type_id": "CREATE INDEX IF NOT EXISTS idx_product_type_id ON Product(type_id)",
+    "idx_product_type_recycle_id": "CREATE INDEX IF NOT EXISTS idx_product_type_recycle_id ON Product(type_recycle_id)",
+    # /product: wszystkie kolumny z PRODUCT_SELECT, więc wyszukanie po kodzie
+    # nie musi sięgać do tabeli (jeden B-drzewo zamiast dwóch)
+    "idx_product_barcode_covering": '''CREATE INDEX IF NOT EXISTS idx_product_barcode_covering ON Product(
+        barcode, name, type_recycle_id, type_id, green_score, carbon_footprint, number_of_verifications, image_url
+    )''',
+}
+
+# Kolejne wersje schematu; numer wersji trzymany jest w PRAGMA user_version.
+# Nowe zmiany dopisujemy na końcu, istniejących nie ruszamy.
+MIGRATIONS = [
+    (1, "indeksy po type_id i type_recycle_id", [
+        INDEXES["idx_product_type_id"],
+        INDEXES["idx_product_type_recycle_id"],
+    ]),
+    (2, "indeks pokrywający wyszukiwanie produktu po kodzie", [
+        INDEXES["idx_product_barcode_covering"],
+    ]),
+    (3, "głosy na kategorie i numer ostatniego zapisanego głosu (votes.py)", [
+        '''CREATE TABLE IF NOT EXISTS Category_votes (
+            product_id INTEGER NOT NULL REFERENCES Product(id),
+            type_recycle_id INTEGER NOT NULL REFERENCES Types_recycle(type_recycle_id),
+            votes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (product_id, type_recycle_id)
+        ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS Vote_log (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            applied_seq INTEGER NOT NULL
+        )''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Wykonuje brakujące migracje, każdą w osobnej transakcji razem ze zmianą
+    user_version, więc przerwana migracja nie zostawia bazy w połowie.
+
+    Returns:
+        Lista zastosowanych wersji.
+    """
+    current = schema_version(conn)
+    applied = []
+    for version, _description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        applied.append(version)
+    if applied:
+        conn.execute("ANALYZE")
+    return applied
+
+
+def require_latest(conn):
+    """ Obrazu tylko do odczytu nie da się migrować - jego schemat musi już być aktualny """
+    version = schema_version(conn)
+    if version != LATEST_VERSION:
+        raise RuntimeError(f"Schemat bazy w wersji {version}, oczekiwano {LATEST_VERSION} - zbuduj obraz ponownie")
+
+
+def create_indexes(conn):
+    for statement in INDEXES.values():
+        conn.execute(statement)
+
+
+def drop_indexes(conn):
+    for name in INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migracje schematu bazy produktów")
+    parser.add_argument("db", nargs="?", default=DB_FILE)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    before = schema_version(conn)
+    applied = migrate(conn)
+    conn.close()
+    if applied:
+        print(f"{args.db}: wersja {before} -> {applied[-1]}")
+    else:
+        print(f"{args.db}: aktualna wersja {before}")
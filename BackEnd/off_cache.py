@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+OFF_CACHE_FILE = os.environ.get("OFF_CACHE_FILE", "off_cache.db")
+# Znaleziony produkt zmienia się rzadko, brak produktu może szybko zniknąć
+POSITIVE_TTL_S = float(os.environ.get("OFF_CACHE_POSITIVE_TTL", 30 * 24 * 60 * 60))
+NEGATIVE_TTL_S = float(os.environ.get("OFF_CACHE_NEGATIVE_TTL", 24 * 60 * 60))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS Responses (
+    barcode TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    product TEXT DEFAULT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (barcode, fields)
+) WITHOUT ROWID;
+'''
+
+
+def fields_key(fields):
+    """ Ten sam zestaw pól niezależnie od kolejności """
+    return ",".join(sorted(field.strip() for field in fields.split(",") if field.strip()))
+
+
+class OFFResponseCache:
+    """
+    Trwały cache odpowiedzi API Open Food Facts po (kod, zestaw pól).
+    Trzyma surowy słownik 'product' albo NULL dla produktów, których
+    OFF nie zna - każdy rodzaj wpisu ma własny czas życia.
+    """
+
+    def __init__(self, path=OFF_CACHE_FILE, positive_ttl=POSITIVE_TTL_S, negative_ttl=NEGATIVE_TTL_S, clock=time.time):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def get(self, barcode, fields):
+        """
+        Returns:
+            (True, product) przy trafieniu - product to None dla zapamiętanego braku,
+            (False, None) gdy wpisu nie ma albo wygasł.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT product, fetched_at FROM Responses WHERE barcode = ? AND fields = ?",
+                (barcode, fields_key(fields)),
+            ).fetchone()
+            if row is not None:
+                product, fetched_at = row
+                ttl = self.positive_ttl if product is not None else self.negative_ttl
+                if fetched_at + ttl > self._clock():
+                    if product is None:
+                        self.negative_hits += 1
+                        return True, None
+                    self.hits += 1
+                    return True, json.loads(product)
+            self.misses += 1
+            return False, None
+
+    def put(self, barcode, fields, product):
+        """ Zapisuje produkt albo, dla product=None, informację o jego braku """
+        payload = json.dumps(product, ensure_ascii=False) if product is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO Responses (barcode, fields, product, fetched_at) VALUES (?, ?, ?, ?)",
+                (barcode, fields_key(fields), payload, self._clock()),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_off_cache():
+    """ Wspólny cache w OFF_CACHE_FILE, otwierany przy pierwszym użyciu """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = OFFResponseCache()
+        return _default_cache
+
+
+def stats_delta(before, after):
+    """ Statystyki z jednego przebiegu na podstawie dwóch odczytów stats() """
+    counts = {key: after[key] - before[key] for key in ("hits", "negative_hits", "misses")}
+    lookups = sum(counts.values())
+    counts["hit_ratio"] = (counts["hits"] + counts["negative_hits"]) / lookups if lookups else 0.0
+    return counts
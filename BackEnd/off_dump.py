@@ -0,0 +1,159 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from data_scrapper import extract_product_info, to_db_record
+
+# Oficjalny zrzut: https://static.openfoodfacts.org/data/openfoodfacts-products.jsonl.gz
+DEFAULT_CHUNK_LINES = 5_000
+
+# Filtry ustawiane raz w każdym procesie roboczym, żeby nie przesyłać ich z każdą paczką
+_wanted_barcodes = None
+_wanted_countries = None
+
+
+def _init_worker(barcodes, countries):
+    global _wanted_barcodes, _wanted_countries
+    _wanted_barcodes = barcodes
+    _wanted_countries = countries
+
+
+def _matches(product):
+    if _wanted_barcodes is not None and str(product.get("code")) not in _wanted_barcodes:
+        return False
+    if _wanted_countries is not None:
+        tags = product.get("countries_tags")
+        if not isinstance(tags, list) or _wanted_countries.isdisjoint(tags):
+            return False
+    return True
+
+
+def extract_chunk(lines):
+    """ Parsuje paczkę linii zrzutu, filtruje i zwraca gotowe linie JSONL dla init_db """
+    out = []
+    for line in lines:
+        try:
+            product = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(product, dict) or not _matches(product):
+            continue
+        info = extract_product_info(product)
+        if info:
+            out.append(json.dumps(to_db_record(info), ensure_ascii=False))
+    return out
+
+
+def _open_dump(path):
+    # Linie trafiają do procesów roboczych jako bajty - dekodowanie też jest równoległe
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def _open_output(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+def _chunks(f, chunk_lines):
+    chunk = []
+    for line in f:
+        chunk.append(line)
+        if len(chunk) >= chunk_lines:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def process_dump(
+    dump_file,
+    output_file,
+    barcodes=None,
+    countries=None,
+    workers=None,
+    chunk_lines=DEFAULT_CHUNK_LINES,
+):
+    """
+    Strumieniowo przetwarza zrzut Open Food Facts (JSONL, opcjonalnie .gz)
+    na rekordy dla init_db. Paczki linii są rozdzielane na pulę procesów;
+    w locie jest najwyżej 2 * workers paczek, więc zużycie pamięci nie
+    zależy od rozmiaru zrzutu. Kolejność wyników odpowiada kolejności w zrzucie.
+
+    Args:
+        dump_file: Plik zrzutu.
+        output_file: Plik wynikowy JSONL (opcjonalnie .gz).
+        barcodes: Zbiór kodów do zachowania (None = wszystkie).
+        countries: Zbiór tagów krajów, np. {"en:poland"} (None = wszystkie).
+        workers: Liczba procesów (domyślnie liczba rdzeni).
+        chunk_lines: Liczba linii w jednej paczce.
+
+    Returns:
+        Słownik ze statystykami: lines, written, elapsed, bytes_per_second.
+    """
+    workers = workers or os.cpu_count() or 1
+    barcodes = frozenset(barcodes) if barcodes is not None else None
+    countries = frozenset(countries) if countries is not None else None
+    lines = written = 0
+    start = time.perf_counter()
+
+    with _open_dump(dump_file) as f, _open_output(output_file) as out, ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(barcodes, countries)
+    ) as pool:
+        in_flight = deque()
+
+        def drain_one():
+            nonlocal written
+            records = in_flight.popleft().result()
+            if records:
+                out.write("\n".join(records) + "\n")
+                written += len(records)
+
+        for chunk in _chunks(f, chunk_lines):
+            if len(in_flight) >= 2 * workers:
+                drain_one()
+            in_flight.append(pool.submit(extract_chunk, chunk))
+            lines += len(chunk)
+            if lines % (chunk_lines * 200) == 0:
+                logging.info(f"Przetworzono {lines} linii, zapisano {written} produktów")
+        while in_flight:
+            drain_one()
+
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(dump_file)
+    return {
+        "lines": lines,
+        "written": written,
+        "elapsed": elapsed,
+        "bytes_per_second": size / elapsed if elapsed else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ekstrakcja produktów ze zrzutu Open Food Facts")
+    parser.add_argument("dump", help="openfoodfacts-products.jsonl(.gz)")
+    parser.add_argument("-o", "--output", default="processed_products.jsonl")
+    parser.add_argument("--barcodes", default=None, help="plik z kodami do zachowania (jeden na linię)")
+    parser.add_argument("--country", action="append", default=None, help="tag kraju, np. en:poland (można powtórzyć)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-lines", type=int, default=DEFAULT_CHUNK_LINES)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    wanted = None
+    if args.barcodes:
+        with open(args.barcodes, "r", encoding="utf-8") as f:
+            wanted = {line.strip() for line in f if line.strip()}
+
+    result = process_dump(args.dump, args.output, wanted, args.country, args.workers, args.chunk_lines)
+    print(
+        f"Zapisano {result['written']} z {result['lines']} produktów do {args.output} "
+        f"w {result['elapsed']:.1f} s ({result['bytes_per_second'] / 2**20:.1f} MB/s)"
+    )
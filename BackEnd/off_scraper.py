@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+import httpx
+
+import metrics
+from data_scrapper import OFF_API_URL, OFF_FIELDS, OFF_HEADERS, extract_product_info, to_db_record
+from off_cache import get_off_cache, stats_delta
+from singleflight import AsyncSingleFlight
+
+# Open Food Facts pozwala na ok. 100 zapytań o produkt na minutę
+DEFAULT_RATE = 100 / 60
+DEFAULT_CONCURRENCY = 8
+# Statusy, po których warto spróbować ponownie
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF_S = 60
+
+# Równoległe fetch_product dla tego samego kodu wysyłają jedno zapytanie
+off_flight = AsyncSingleFlight()
+
+
+class TokenBucket:
+    """
+    Limiter zapytań: żetony dosypują się w tempie rate na sekundę, w wiadrze
+    mieści się najwyżej capacity. Każde zapytanie zabiera jeden żeton.
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Czekający ustawiają się w kolejce na blokadzie, więc żetony są wydawane po kolei
+        async with self._lock:
+            while True:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class FetchError(Exception):
+    """ Nie udało się pobrać produktu mimo ponownych prób """
+
+
+def _retry_delay(attempt, backoff, response=None):
+    """ Wykładnicze opóźnienie z losowym rozrzutem; Retry-After serwera ma pierwszeństwo """
+    delay = backoff * 2 ** attempt * random.uniform(1, 2)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get("Retry-After", 0)))
+        except ValueError:
+            pass
+    return min(delay, MAX_BACKOFF_S)
+
+
+async def fetch_product(client, barcode, limiter, api_url=OFF_API_URL, retries=5, backoff=0.5, cache=None):
+    """
+    Pobiera surowe dane produktu z API Open Food Facts. Trafienie w cache
+    nie zużywa żetonu limitera.
+
+    Args:
+        client: Współdzielony httpx.AsyncClient.
+        barcode: Kod kreskowy produktu.
+        limiter: TokenBucket ograniczający tempo zapytań.
+        api_url: Adres bazowy API produktów.
+        retries: Liczba ponownych prób po 429/5xx lub błędzie połączenia.
+        backoff: Opóźnienie pierwszej ponownej próby w sekundach.
+        cache: OFFResponseCache; domyślnie wspólny get_off_cache().
+
+    Returns:
+        Słownik 'product' albo None, gdy produktu nie ma w bazie OFF.
+    """
+    cache = cache or get_off_cache()
+    hit, product = cache.get(barcode, OFF_FIELDS)
+    if hit:
+        return product
+
+    return await off_flight.do(
+        (api_url, barcode),
+        lambda: _request_product(client, barcode, limiter, api_url, retries, backoff, cache),
+    )
+
+
+async def _request_product(client, barcode, limiter, api_url, retries, backoff, cache):
+    """ Zapytania do API z ponawianiem dla fetch_product; wynik trafia do cache """
+    url = f"{api_url}/{barcode}.json"
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        response = None
+        try:
+            with metrics.span("off_request"):
+                response = await client.get(url, params={"fields": OFF_FIELDS})
+        except httpx.TransportError as e:
+            error = f"{type(e).__name__}: {e}"
+            metrics.upstream_errors.inc("off", type(e).__name__)
+        else:
+            if response.status_code == 404:
+                cache.put(barcode, OFF_FIELDS, None)
+                return None
+            if response.status_code not in RETRY_STATUSES:
+                if response.is_error:
+                    metrics.upstream_errors.inc("off", f"HTTP {response.status_code}")
+                response.raise_for_status()
+                with metrics.span("off_json_decode"):
+                    product = response.json().get("product") or None
+                cache.put(barcode, OFF_FIELDS, product)
+                return product
+            error = f"HTTP {response.status_code}"
+            metrics.upstream_errors.inc("off", error)
+
+        if attempt == retries:
+            raise FetchError(f"{barcode}: {error} po {retries + 1} próbach")
+        delay = _retry_delay(attempt, backoff, response)
+        logging.warning(f"{barcode}: {error}, ponowna próba za {delay:.1f} s")
+        await asyncio.sleep(delay)
+
+
+def load_done(output_file, checkpoint_file):
+    """
+    Kody, których nie trzeba pobierać ponownie: zapisane w checkpoincie
+    (także nieznalezione) oraz te, które już trafiły do pliku wynikowego.
+    """
+    done = set()
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file, "r", encoding="utf-8") as f:
+            done.update(line.strip() for line in f if line.strip())
+    if os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(str(json.loads(line)["barcode"]))
+                except (ValueError, KeyError, TypeError):
+                    # Ostatnia linia mogła zostać urwana przy awarii
+                    continue
+    return done
+
+
+async def scrape_barcodes(
+    barcodes,
+    output_file,
+    checkpoint_file=None,
+    concurrency=DEFAULT_CONCURRENCY,
+    rate=DEFAULT_RATE,
+    api_url=OFF_API_URL,
+    checkpoint_every=100,
+    retries=5,
+    backoff=0.5,
+    cache=None,
+):
+    """
+    Pobiera produkty dla listy kodów równolegle i dopisuje je do pliku JSONL
+    na bieżąco. Co checkpoint_every kodów dopisuje przetworzone kody do
+    pliku checkpointu, więc po przerwaniu można wznowić bez ponownego
+    pobierania.
+
+    Returns:
+        Słownik ze statystykami: fetched, not_found, failed, skipped, elapsed,
+        per_second, cache (trafienia w cache odpowiedzi OFF w tym przebiegu) oraz
+        coalesced (zapytania dołączone do trwającego pobrania tego samego kodu).
+    """
+    cache = cache or get_off_cache()
+    cache_before = cache.stats()
+    coalesced_before = off_flight.coalesced
+    checkpoint_file = checkpoint_file or output_file + ".done"
+    done = load_done(output_file, checkpoint_file)
+    queue = asyncio.Queue()
+    for barcode in dict.fromkeys(barcodes):
+        if barcode not in done:
+            queue.put_nowait(barcode)
+
+    stats = {"fetched": 0, "not_found": 0, "failed": 0, "skipped": len(barcodes) - queue.qsize()}
+    total = queue.qsize()
+    pending = []  # kody przetworzone od ostatniego checkpointu
+    limiter = TokenBucket(rate)
+
+    with open(output_file, "a", encoding="utf-8") as out, open(checkpoint_file, "a", encoding="utf-8") as checkpoint:
+        def write_checkpoint():
+            # Najpierw wyniki, potem checkpoint - checkpoint nigdy nie wyprzedza pliku wynikowego
+            out.flush()
+            checkpoint.write("".join(f"{barcode}\n" for barcode in pending))
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+            pending.clear()
+
+        async def worker():
+            while True:
+                try:
+                    barcode = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    product = await fetch_product(client, barcode, limiter, api_url, retries, backoff, cache)
+                except (FetchError, httpx.HTTPError, ValueError) as e:
+                    # Bez wpisu do checkpointu - kod zostanie pobrany przy następnym uruchomieniu
+                    logging.error(f"Pominięto {barcode}: {e}")
+                    stats["failed"] += 1
+                    continue
+
+                info = extract_product_info(product) if product else None
+                if info:
+                    out.write(json.dumps(to_db_record(info), ensure_ascii=False) + "\n")
+                    stats["fetched"] += 1
+                else:
+                    stats["not_found"] += 1
+                pending.append(barcode)
+
+                processed = stats["fetched"] + stats["not_found"] + stats["failed"]
+                if len(pending) >= checkpoint_every:
+                    write_checkpoint()
+                    logging.info(f"Postęp: {processed}/{total} ({processed / (time.perf_counter() - start):.1f} kodów/s)")
+
+        start = time.perf_counter()
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(headers=OFF_HEADERS, timeout=20, limits=limits) as client:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        write_checkpoint()
+
+    stats["elapsed"] = time.perf_counter() - start
+    processed = total - stats["failed"]
+    stats["per_second"] = processed / stats["elapsed"] if stats["elapsed"] else 0.0
+    stats["cache"] = stats_delta(cache_before, cache.stats())
+    stats["coalesced"] = off_flight.coalesced - coalesced_before
+    logging.info(
+        f"Cache OFF: trafienia {stats['cache']['hits']}, zapamiętane braki {stats['cache']['negative_hits']}, "
+        f"chybienia {stats['cache']['misses']} ({stats['cache']['hit_ratio']:.1%})"
+    )
+    return stats
+
+
+def read_barcodes(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Równoległe pobieranie produktów z Open Food Facts")
+    parser.add_argument("barcodes", nargs="?", default="polish_barcodes.txt", help="plik z kodami (jeden na linię)")
+    parser.add_argument("-o", "--output", default="api_processed_products.jsonl")
+    parser.add_argument("--checkpoint", default=None, help="plik checkpointu (domyślnie <output>.done)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="zapytań na sekundę")
+    parser.add_argument("--limit", type=int, default=None, help="przetwórz tylko pierwsze N kodów")
+    parser.add_argument("--api-url", default=OFF_API_URL)
+    parser.add_argument("--metrics-file", default=None, help="zapisz metryki (format Prometheus) po zakończeniu")
+    args = parser.parse_args()
+
+    codes = read_barcodes(args.barcodes)[:args.limit]
+    result = asyncio.run(scrape_barcodes(
+        codes, args.output, args.checkpoint, args.concurrency, args.rate, args.api_url,
+    ))
+    print(
+        f"Pobrano {result['fetched']}, nie znaleziono {result['not_found']}, błędy {result['failed']}, "
+        f"pominięto (checkpoint) {result['skipped']} - {result['per_second']:.1f} kodów/s, "
+        f"cache {result['cache']['hit_ratio']:.1%}"
+    )
+    if args.metrics_file:
+        metrics.registry.write(args.metrics_file)
@@ -0,0 +1,134 @@
+"""
+Sprawdza EXPLAIN QUERY PLAN zapytań API, żeby pełny skan tabeli nie wrócił
+na gorącą ścieżkę po zmianie schematu lub zapytania.
+
+    python query_plans.py            # schemat z init_db + wszystkie migracje
+    python query_plans.py waste.db   # schemat istniejącej bazy
+
+Plany zależą od statystyk ANALYZE, dlatego sprawdzane są zawsze na bazie
+w pamięci z przykładowymi danymi - z pliku brany jest tylko schemat.
+
+Kończy się kodem 1, gdy któryś plan odbiega od oczekiwanego.
+"""
+import argparse
+import sqlite3
+import sys
+
+import init_db
+import migrations
+from api import PRODUCT_SELECT, WASTE_TYPE_SELECT
+from votes import CATEGORY_ASSIGN, CATEGORY_VOTE_UPSERT, VERIFY_UPDATE
+
+# (nazwa, zapytanie, parametry, fragmenty, które muszą wystąpić w planie)
+CHECKS = [
+    ("/product", PRODUCT_SELECT + "WHERE P.barcode = ?", ("1",), [
+        "SEARCH P USING COVERING INDEX idx_product_barcode_covering (barcode=?)",
+        "SEARCH T USING INTEGER PRIMARY KEY (rowid=?)",
+        "SEARCH TR USING INTEGER PRIMARY KEY (rowid=?)",
+    ]),
+    ("/products/batch", PRODUCT_SELECT + "WHERE P.barcode IN (?,?,?)", ("1", "2", "3"), [
+        "SEARCH P USING COVERING INDEX idx_product_barcode_covering (barcode=?)",
+        "SEARCH T USING INTEGER PRIMARY KEY (rowid=?)",
+        "SEARCH TR USING INTEGER PRIMARY KEY (rowid=?)",
+    ]),
+    ("get_waste_type", WASTE_TYPE_SELECT, (1,), [
+        "SEARCH P USING INTEGER PRIMARY KEY (rowid=?)",
+        "SEARCH T USING INTEGER PRIMARY KEY (rowid=?)",
+    ]),
+    # Zapis partii głosów: każdy wiersz partii to wyszukanie po kodzie
+    ("zapis weryfikacji", VERIFY_UPDATE, (1, "1"), [
+        "SEARCH Product USING INDEX sqlite_autoindex_Product_1 (barcode=?)",
+    ]),
+    ("zapis głosu na kategorię", CATEGORY_VOTE_UPSERT, (1, "1", "a"), [
+        "SEARCH P USING COVERING INDEX sqlite_autoindex_Product_1 (barcode=?)",
+        "SEARCH TR USING COVERING INDEX sqlite_autoindex_Types_recycle_1 (type_name=?)",
+    ]),
+    ("przypisanie kategorii z głosów", CATEGORY_ASSIGN, (1, "1"), [
+        "SEARCH Product USING INDEX sqlite_autoindex_Product_1 (barcode=?)",
+        "SEARCH CV USING PRIMARY KEY (product_id=?)",
+    ]),
+    ("typ po nazwie", "SELECT type_id FROM Types WHERE type_name = ?", ("a",), [
+        "SEARCH Types USING COVERING INDEX sqlite_autoindex_Types_1 (type_name=?)",
+    ]),
+    ("produkty kategorii", "SELECT id, name, barcode FROM Product WHERE type_id = ?", (1,), [
+        "SEARCH Product USING INDEX idx_product_type_id (type_id=?)",
+    ]),
+    ("produkty materiału", "SELECT id, name, barcode FROM Product WHERE type_recycle_id = ?", (1,), [
+        "SEARCH Product USING INDEX idx_product_type_recycle_id (type_recycle_id=?)",
+    ]),
+    # Statystyki muszą przejść po wszystkich wierszach - ale po wąskim indeksie, nie po tabeli
+    ("liczba produktów w kategoriach", "SELECT type_id, COUNT(*) FROM Product GROUP BY type_id", (), [
+        "SCAN Product USING COVERING INDEX idx_product_type_id",
+    ]),
+    ("liczba produktów z materiału", "SELECT type_recycle_id, COUNT(*) FROM Product GROUP BY type_recycle_id", (), [
+        "SCAN Product USING COVERING INDEX idx_product_type_recycle_id",
+    ]),
+]
+
+
+def sample_db(schema_from=None, products=1000):
+    """
+    Baza w pamięci z przykładowymi danymi i statystykami ANALYZE. Schemat
+    pochodzi z pliku schema_from albo z init_db po wszystkich migracjach.
+    """
+    conn = sqlite3.connect(":memory:")
+    if schema_from:
+        source = sqlite3.connect(schema_from)
+        statements = [row[0] for row in source.execute(
+            "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY type DESC"
+        )]
+        source.close()
+        for statement in statements:
+            conn.execute(statement)
+    else:
+        init_db.create_schema(conn)
+    conn.executemany("INSERT INTO Types (type_name) VALUES (?)", [(f"type-{i}",) for i in range(20)])
+    conn.executemany("INSERT INTO Types_recycle (type_name) VALUES (?)", [(f"material-{i}",) for i in range(5)])
+    conn.executemany(
+        "INSERT INTO Product (name, type_recycle_id, type_id, barcode) VALUES (?, ?, ?, ?)",
+        [(f"Produkt {i}", i % 5 + 1, i % 20 + 1, f"{5900000000000 + i}") for i in range(products)],
+    )
+    conn.commit()
+    if schema_from:
+        conn.execute("ANALYZE")
+    else:
+        migrations.migrate(conn)
+    return conn
+
+
+def query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def check_query_plans(conn):
+    """
+    Returns:
+        Lista opisów błędów (pusta, gdy wszystkie plany są w porządku).
+    """
+    failures = []
+    for name, sql, params, expected in CHECKS:
+        try:
+            plan = query_plan(conn, sql, params)
+        except sqlite3.OperationalError as e:
+            # Np. tabela z nowszej migracji w bazie, której jeszcze nie zmigrowano
+            failures.append(f"{name}: {e} (python migrations.py <baza>)")
+            continue
+        missing = [step for step in expected if not any(detail.startswith(step) for detail in plan)]
+        full_scans = [detail for detail in plan if detail.startswith("SCAN") and "COVERING INDEX" not in detail]
+        if missing or full_scans:
+            failures.append(f"{name}: plan {plan}, brakuje {missing}, pełne skany {full_scans}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", nargs="?", default=None, help="plik bazy, z którego brany jest schemat")
+    args = parser.parse_args()
+
+    conn = sample_db(args.db)
+    failures = check_query_plans(conn)
+    conn.close()
+    for failure in failures:
+        print(failure)
+    print(f"{len(CHECKS) - len(failures)}/{len(CHECKS)} planów zgodnych z oczekiwanymi")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,263 @@
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import bin_store
+from bin_store import KM_PER_DEGREE, SNAPSHOT_FILE, load_bin_store
+from distance import EARTH_RADIUS_KM
+from singleflight import SingleFlight
+
+# bbox: (south, west, north, east) - zasięg miasta z niewielkim zapasem
+Region = namedtuple("Region", "name area admin_level bbox")
+
+REGIONS = {region.name: region for region in [
+    Region("krakow", "Kraków", "8", (49.96, 19.78, 50.13, 20.23)),
+    Region("warszawa", "Warszawa", "8", (52.09, 20.85, 52.37, 21.28)),
+    Region("wroclaw", "Wrocław", "8", (51.04, 16.80, 51.22, 17.18)),
+    Region("lodz", "Łódź", "8", (51.68, 19.32, 51.86, 19.64)),
+    Region("poznan", "Poznań", "8", (52.29, 16.73, 52.51, 17.07)),
+    Region("gdansk", "Gdańsk", "8", (54.27, 18.42, 54.45, 18.95)),
+    Region("katowice", "Katowice", "8", (50.13, 18.89, 50.30, 19.13)),
+]}
+DEFAULT_REGION = "krakow"
+
+# Ile koszy łącznie mogą mieć wczytane regiony (poza domyślnym) zanim najdawniej
+# używane zostaną zwolnione
+MAX_LOADED_BINS = int(os.environ.get("BIN_REGIONS_MAX_BINS", 2_000_000))
+
+
+def region_snapshot_path(name):
+    """ Zrzut regionu; domyślny region korzysta z dotychczasowego pliku """
+    if name == DEFAULT_REGION:
+        return SNAPSHOT_FILE
+    return f"waste_bins_snapshot_{name}.json"
+
+
+def load_region(name):
+    """ Indeks koszy regionu z jego zrzutu (albo gotowego indeksu) na dysku """
+    if name == DEFAULT_REGION:
+        return bin_store.get_bin_store()
+    return load_bin_store(region_snapshot_path(name))
+
+
+def bbox_gap_km(lat, lon, bboxes):
+    """
+    Dolne ograniczenie odległości od punktu do dowolnego punktu w każdym
+    z bboxów (0 wewnątrz). bboxes to tablica (n, 4) z (south, west, north, east).
+    """
+    south, west, north, east = np.asarray(bboxes, dtype=float).T
+    gap_lat = np.maximum(np.maximum(south - lat, lat - north), 0.0)
+    gap_lon = np.maximum(np.maximum(west - lon, lon - east), 0.0)
+    bound_lat = gap_lat * KM_PER_DEGREE
+    # Wzdłuż równoleżnika odległość maleje z cos(lat) - bierzemy najmniejszy cos w zasięgu
+    max_abs_lat = np.maximum(abs(lat), np.maximum(np.abs(south), np.abs(north)))
+    bound_lon = 2 * EARTH_RADIUS_KM * np.arcsin(
+        np.minimum(1.0, np.cos(np.radians(max_abs_lat)) * np.sin(np.radians(gap_lon) / 2))
+    )
+    return np.maximum(bound_lat, bound_lon)
+
+
+class RegionIndex:
+    """
+    Kosze podzielone na regiony (miasta). Indeks regionu wczytywany jest
+    przy pierwszym zapytaniu w jego pobliżu; gdy wczytane regiony mają
+    razem więcej niż max_bins koszy, najdawniej używane są zwalniane.
+    Region domyślny trzyma bin_store (odświeżanie, podmiana) i nie jest zwalniany.
+
+    Zrzut czytany jest poza blokadą (równoległe zapytania o ten sam region
+    czekają na jedno wczytanie), więc zapytania o wczytane już regiony nie
+    stoją za nim. Brak zrzutu nie jest zapamiętywany - region pobrany później
+    osobnym procesem (fetch_waste_bins.py) działa bez restartu API.
+    """
+
+    def __init__(self, regions=None, loader=load_region, max_bins=MAX_LOADED_BINS, default=DEFAULT_REGION):
+        self.regions = list(regions if regions is not None else REGIONS.values())
+        self._names = [region.name for region in self.regions]
+        self._bboxes = np.array([region.bbox for region in self.regions], dtype=float).reshape(-1, 4)
+        self.default = default
+        self.max_bins = max_bins
+        self._loader = loader
+        self._loaded = OrderedDict()  # nazwa -> BinStore
+        self._missing = set()  # regiony bez zrzutu przy ostatniej próbie (ostrzeżenie raz)
+        self._default_store = None
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.loads = 0
+        self.evictions = 0
+
+    def regions_near(self, lat, lon, radius_km=math.inf):
+        """ Regiony, które mogą mieć kosze w promieniu radius_km, od najbliższego """
+        gaps = bbox_gap_km(lat, lon, self._bboxes)
+        order = np.argsort(gaps, kind="stable")
+        return [(gap, self._names[i]) for i, gap in zip(order.tolist(), gaps[order].tolist()) if gap <= radius_km]
+
+    def store(self, name):
+        """ Indeks regionu (wczytywany przy pierwszym użyciu) albo None, gdy nie ma zrzutu """
+        if name == self.default:
+            try:
+                store = self._loader(name)
+            except (OSError, ValueError):
+                return None
+            if store is not self._default_store:
+                self._default_store = store
+                self._extend(name, store)
+            return store
+
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+        return self._flight.do(name, lambda: self._load(name))
+
+    def _load(self, name):
+        try:
+            store = self._loader(name)
+        except (OSError, ValueError) as e:
+            with self._lock:
+                if name not in self._missing:
+                    logging.warning(f"Brak indeksu koszy dla regionu {name}: {e}")
+                    self._missing.add(name)
+            return None
+        with self._lock:
+            self.loads += 1
+            self._missing.discard(name)
+            # set_store w trakcie wczytywania ma nowszy indeks
+            if name in self._loaded:
+                return self._loaded[name]
+            self._loaded[name] = store
+            self._extend(name, store)
+            self._evict()
+            return store
+
+    def set_store(self, name, store):
+        """ Podmienia indeks regionu (np. po odświeżeniu zrzutu) """
+        if name == self.default:
+            bin_store.set_bin_store(store)
+            self._default_store = store
+            self._extend(name, store)
+            return
+        with self._lock:
+            self._loaded[name] = store
+            self._loaded.move_to_end(name)
+            self._extend(name, store)
+            self._evict()
+
+    def _extend(self, name, store):
+        # Ręcznie wpisany bbox może nie objąć wszystkich koszy ze zrzutu - poszerzamy
+        # go o zasięg danych, żeby zapytania przy krańcach regionu go nie pomijały
+        if store is None or not len(store):
+            return
+        bboxes = self._bboxes.copy()
+        row = bboxes[self._names.index(name)]
+        row[:2] = np.minimum(row[:2], (store.lats.min(), store.lons.min()))
+        row[2:] = np.maximum(row[2:], (store.lats.max(), store.lons.max()))
+        self._bboxes = bboxes
+
+    def _evict(self):
+        # Ostatnio użyty region zostaje zawsze, nawet gdy sam przekracza limit
+        total = sum(len(store) for store in self._loaded.values())
+        while total > self.max_bins and len(self._loaded) > 1:
+            _, store = self._loaded.popitem(last=False)
+            total -= len(store)
+            self.evictions += 1
+
+    def is_loaded(self, name):
+        """ Czy store(name) odpowie bez czytania zrzutu z dysku """
+        if name == self.default:
+            return self._default_store is not None
+        return name in self._loaded
+
+    def loaded_regions(self):
+        with self._lock:
+            return list(self._loaded)
+
+    def regions_in_bbox(self, bbox):
+        """ Nazwy regionów, których zasięg przecina podany bbox (south, west, north, east) """
+        south, west, north, east = bbox
+        r_south, r_west, r_north, r_east = self._bboxes.T
+        hits = (r_south <= north) & (south <= r_north) & (r_west <= east) & (west <= r_east)
+        return [self._names[i] for i in np.flatnonzero(hits).tolist()]
+
+    def stores(self, names):
+        """ Indeksy podanych regionów, bez regionów bez zrzutu """
+        stores = (self.store(name) for name in names)
+        return [store for store in stores if store is not None]
+
+    def query_radius(self, lat, lon, radius_km, type_filter=None):
+        """
+        Kosze w promieniu radius_km ze wszystkich regionów w pobliżu.
+
+        Returns:
+            Lista (store, indeksy, odległości) dla regionów z wynikami albo
+            None, gdy żaden z pobliskich regionów nie ma indeksu.
+        """
+        results = []
+        available = False
+        for _, name in self.regions_near(lat, lon, radius_km):
+            store = self.store(name)
+            if store is None:
+                continue
+            available = True
+            indexes, distances = store.query_radius(lat, lon, radius_km, type_filter)
+            if len(indexes):
+                results.append((store, indexes, distances))
+        if not available and self.regions_near(lat, lon, radius_km):
+            return None
+        return results
+
+    def nearest(self, lat, lon, k=1, type_filter=None, max_distance_km=None):
+        """
+        k najbliższych koszy ze wszystkich regionów. Regiony przeglądane są
+        od najbliższego i pomijane, gdy ich bbox jest dalej niż obecny k-ty kosz.
+
+        Returns:
+            Lista (odległość, store, indeks) posortowana po odległości albo
+            None, gdy żaden z przeglądanych regionów nie ma indeksu.
+        """
+        if k <= 0:
+            return []
+        radius = max_distance_km if max_distance_km is not None else math.inf
+        best = []
+        available = False
+        candidates = self.regions_near(lat, lon, radius)
+        for order, (gap, name) in enumerate(candidates):
+            if len(best) == k and gap >= best[-1][0]:
+                break
+            store = self.store(name)
+            if store is None:
+                continue
+            available = True
+            indexes, distances = store.nearest(lat, lon, k, type_filter, max_distance_km)
+            best.extend(
+                (distance, order, index, store)
+                for index, distance in zip(indexes.tolist(), distances.tolist())
+            )
+            best.sort(key=lambda item: item[:3])
+            del best[k:]
+        if not available and candidates:
+            return None
+        return [(distance, store, index) for distance, _, index, store in best]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_region_index():
+    """ Współdzielony indeks regionów """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = RegionIndex()
+    return _index
+
+
+def set_region_index(index):
+    global _index
+    with _index_lock:
+        _index = index
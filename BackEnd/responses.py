@@ -0,0 +1,27 @@
+import orjson
+from fastapi.responses import JSONResponse
+
+# Kosze jako słownik kolumn {"lat": [...], "lon": [...], "type": [...], "distance": [...]}
+# zamiast listy wierszy - klient wybiera go nagłówkiem Accept
+BINS_COLUMNS_MEDIA_TYPE = "application/vnd.bins-columns+json"
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Odpowiedź JSON serializowana przez orjson. Handler zwracający ją wprost
+    omija jsonable_encoder FastAPI; orjson sam obsługuje dataclassy i tablice NumPy.
+    """
+
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def wants_columns(request):
+    """ Czy klient poprosił o kosze w formacie kolumn (Accept: BINS_COLUMNS_MEDIA_TYPE) """
+    return BINS_COLUMNS_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def bins_response(bins, columns):
+    """ Lista koszy albo słownik kolumn; błąd ({"error": ...}) zawsze jako zwykły JSON """
+    media_type = BINS_COLUMNS_MEDIA_TYPE if columns and "error" not in bins else None
+    return FastJSONResponse(bins, media_type=media_type, headers={"Vary": "Accept"})
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+
+class AsyncSingleFlight:
+    """
+    Łączy równoległe wywołania o tym samym kluczu: pierwsze uruchamia
+    pracę, kolejne czekają na jej wynik (lub wyjątek). Praca działa jako
+    osobne zadanie, więc anulowanie jednego z czekających (np. przez limit
+    czasu) nie przerywa jej pozostałym.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """ Wynik await fn() - wspólny dla wszystkich wywołań z kluczem key w tym samym czasie """
+        self.calls += 1
+        future = self._flights.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._flights[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def _finish(self, key, future):
+        if self._flights.get(key) is future:
+            del self._flights[key]
+        # Wyjątek odbierają czekający; gdy wszyscy zrezygnowali, nie chcemy ostrzeżenia asyncio
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Odpowiednik AsyncSingleFlight dla kodu działającego w wątkach """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            self.calls += 1
+            call = self._flights.get(key)
+            leader = call is None
+            if leader:
+                call = self._flights[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._flights)}
@@ -0,0 +1,68 @@
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import init_db  # noqa: E402
+import migrations  # noqa: E402
+
+KRAKOW_CENTER = (50.06143, 19.93658)
+BIN_CATEGORIES = ["glass", "paper", "plastic", "metal", "organic"]
+
+
+def make_elements(n, seed=0, center=KRAKOW_CENTER, spread_deg=0.05, first_id=0):
+    """ n węzłów w formacie Overpass wokół center (jak synthetic_elements w benchmark.py) """
+    rng = random.Random(seed)
+    elements = []
+    for i in range(n):
+        if rng.random() < 0.4:
+            tags = {"amenity": "waste_basket"}
+        else:
+            tags = {"amenity": "recycling", "recycling_type": "container"}
+            for category in rng.sample(BIN_CATEGORIES, rng.randint(1, 2)):
+                tags[f"recycling:{category}"] = "yes"
+        elements.append({
+            "type": "node",
+            "id": first_id + i,
+            "version": 1,
+            "lat": center[0] + rng.uniform(-spread_deg, spread_deg),
+            "lon": center[1] + rng.uniform(-spread_deg, spread_deg) * 1.5,
+            "tags": tags,
+        })
+    return elements
+
+
+def random_points(n, seed=1, center=KRAKOW_CENTER, spread_deg=0.05):
+    rng = random.Random(seed)
+    return [
+        (center[0] + rng.uniform(-spread_deg, spread_deg), center[1] + rng.uniform(-spread_deg, spread_deg) * 1.5)
+        for _ in range(n)
+    ]
+
+
+@pytest.fixture
+def elements():
+    return make_elements(2000)
+
+
+@pytest.fixture
+def product_db(tmp_path):
+    """ Pusta baza produktów (schemat init_db + migracje) podpięta jako db.pool """
+    path = str(tmp_path / "waste.db")
+    conn = sqlite3.connect(path)
+    init_db.create_schema(conn)
+    migrations.migrate(conn)
+    conn.close()
+
+    previous = db.pool
+    db.pool = db.ConnectionPool(path)
+    try:
+        yield path
+    finally:
+        db.pool.close_all()
+        db.pool = previous
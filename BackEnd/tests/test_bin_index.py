@@ -0,0 +1,36 @@
+import json
+import os
+
+import numpy as np
+
+from bin_store import BinStore, index_path, load_bin_store
+from conftest import random_points
+
+
+def test_index_round_trip(tmp_path, elements):
+    store = BinStore(elements)
+    path = str(tmp_path / "bins.index")
+    store.save_index(path)
+    loaded = BinStore.from_index(path)
+
+    assert len(loaded) == len(store)
+    assert np.array_equal(loaded.lats, store.lats) and np.array_equal(loaded.lons, store.lons)
+    for category in (None, "glass", "plastic"):
+        assert np.array_equal(loaded.type_mask(category), store.type_mask(category))
+    for lat, lon in random_points(20):
+        for got, expected in zip(loaded.nearest(lat, lon, k=3, type_filter="paper"),
+                                 store.nearest(lat, lon, k=3, type_filter="paper")):
+            assert np.array_equal(got, expected)
+        assert np.array_equal(loaded.query_radius(lat, lon, 0.5)[0], store.query_radius(lat, lon, 0.5)[0])
+
+
+def test_newer_snapshot_wins_over_index(tmp_path, elements):
+    snapshot = str(tmp_path / "bins.json")
+    with open(snapshot, "w", encoding="utf-8") as f:
+        json.dump({"elements": elements[:10]}, f)
+    BinStore(elements[:5]).save_index(index_path(snapshot))
+    assert len(load_bin_store(snapshot)) == 5
+
+    stat = os.stat(index_path(snapshot))
+    os.utime(snapshot, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert len(load_bin_store(snapshot)) == 10
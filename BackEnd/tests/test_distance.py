@@ -0,0 +1,45 @@
+import numpy as np
+
+from bin_store import BinStore
+from conftest import KRAKOW_CENTER, random_points
+from distance import coverage, haversine_distance, haversine_matrix, haversine_np
+
+
+def coordinates(elements):
+    return np.array([e["lat"] for e in elements]), np.array([e["lon"] for e in elements])
+
+
+def test_haversine_np_matches_scalar(elements):
+    lats, lons = coordinates(elements)
+    lat, lon = KRAKOW_CENTER
+    expected = [haversine_distance(lat, lon, b_lat, b_lon) for b_lat, b_lon in zip(lats, lons)]
+    assert np.allclose(haversine_np(lat, lon, lats, lons), expected, rtol=0, atol=1e-9)
+
+
+def test_haversine_matrix_matches_scalar(elements):
+    lats, lons = coordinates(elements[:50])
+    users = random_points(20)
+    matrix = haversine_matrix([u[0] for u in users], [u[1] for u in users], lats, lons)
+    assert matrix.shape == (20, 50)
+    for row, (u_lat, u_lon) in enumerate(users):
+        for col in (0, 17, 49):
+            assert abs(matrix[row, col] - haversine_distance(u_lat, u_lon, lats[col], lons[col])) < 1e-9
+
+
+def test_coverage_chunks_and_grid_agree(elements):
+    lats, lons = coordinates(elements)
+    users = random_points(200)
+    user_lats = [u[0] for u in users]
+    user_lons = [u[1] for u in users]
+    whole = coverage(user_lats, user_lons, lats, lons, radius_km=0.5, max_elements=10**9)
+    chunked = coverage(user_lats, user_lons, lats, lons, radius_km=0.5, max_elements=len(lats) * 7)
+    indexed = BinStore(elements).coverage(user_lats, user_lons, radius_km=0.5)
+    for nearest, counts in (chunked, indexed):
+        assert np.allclose(nearest, whole[0], rtol=0, atol=1e-9)
+        assert (counts == whole[1]).all()
+    assert whole[1].sum() > 0
+
+
+def test_coverage_without_bins():
+    nearest, counts = coverage([50.0], [19.9], [], [])
+    assert np.isinf(nearest).all() and (counts == 0).all()
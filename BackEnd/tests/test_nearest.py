@@ -0,0 +1,69 @@
+import heapq
+import math
+
+import numpy as np
+import pytest
+
+from bin_store import BinStore, matches_type
+from conftest import make_elements, random_points
+from distance import haversine_distance, haversine_np
+from regions import Region, RegionIndex
+
+
+def brute_force(elements, lat, lon, type_filter, k):
+    """ k najbliższych koszy pełnym skanem haversine: [(odległość, indeks)] """
+    return heapq.nsmallest(k, (
+        (haversine_distance(lat, lon, e["lat"], e["lon"]), i)
+        for i, e in enumerate(elements) if matches_type(e["tags"], type_filter)
+    ))
+
+
+@pytest.mark.parametrize("type_filter", [None, "glass", "paper", "organic"])
+@pytest.mark.parametrize("k", [1, 5])
+def test_nearest_ranking_matches_full_scan(elements, type_filter, k):
+    store = BinStore(elements)
+    for lat, lon in random_points(25, seed=k):
+        expected = brute_force(elements, lat, lon, type_filter, k)
+        indexes, distances = store.nearest(lat, lon, k=k, type_filter=type_filter)
+        assert indexes.tolist() == [i for _, i in expected]
+        assert np.allclose(distances, [d for d, _ in expected], rtol=0, atol=1e-9)
+
+
+def test_nearest_respects_max_distance(elements):
+    store = BinStore(elements)
+    lat, lon = random_points(1, seed=3)[0]
+    _, distances = store.nearest(lat, lon, k=50, type_filter="glass", max_distance_km=0.3)
+    expected = [d for d, _ in brute_force(elements, lat, lon, "glass", 50) if d <= 0.3]
+    assert np.allclose(distances, expected, rtol=0, atol=1e-9)
+
+
+def test_nearest_from_far_away(elements):
+    # Punkt daleko poza siatką - pierścienie zaczynają się od jej krawędzi
+    store = BinStore(elements)
+    expected = brute_force(elements, 52.23, 21.01, None, 3)
+    assert store.nearest(52.23, 21.01, k=3)[0].tolist() == [i for _, i in expected]
+
+
+def test_region_index_matches_single_index_at_borders():
+    # Dwa przylegające regiony; kosze aż do wspólnej krawędzi
+    regions = [
+        Region("west", "West", "8", (50.0, 19.8, 50.1, 19.95)),
+        Region("east", "East", "8", (50.0, 19.95, 50.1, 20.1)),
+    ]
+    elements = {
+        "west": make_elements(800, seed=1, center=(50.05, 19.875), spread_deg=0.05),
+        "east": make_elements(800, seed=2, center=(50.05, 20.025), spread_deg=0.05, first_id=800),
+    }
+    everything = elements["west"] + elements["east"]
+    index = RegionIndex(regions, loader=lambda name: BinStore(elements[name]), max_bins=math.inf, default=None)
+    lats = np.array([e["lat"] for e in everything])
+    lons = np.array([e["lon"] for e in everything])
+    glass = np.array([matches_type(e["tags"], "glass") for e in everything])
+
+    for lat in np.linspace(50.01, 50.09, 9):
+        lon = 19.95 + (lat - 50.05) / 20
+        distances = haversine_np(lat, lon, lats, lons)
+        got = [distance for distance, _, _ in index.nearest(lat, lon, 5, "glass")]
+        assert np.allclose(got, np.sort(distances[glass])[:5])
+        results = index.query_radius(lat, lon, 1, "glass")
+        assert sum(len(indexes) for _, indexes, _ in results) == np.count_nonzero(glass & (distances <= 1))
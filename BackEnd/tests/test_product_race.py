@@ -0,0 +1,32 @@
+import threading
+
+import api
+import db
+
+
+def test_concurrent_scans_create_one_product(product_db):
+    api.product_cache.clear()
+    for round_ in range(5):
+        barcode = f"race-{round_}"
+        barrier = threading.Barrier(16)
+        results = []
+        errors = []
+
+        def scan():
+            barrier.wait()
+            try:
+                results.append(api.get_or_create_product(barcode))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=scan) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(results) == 16 and len({product.id for product in results}) == 1
+        count = db.get_connection().execute("SELECT COUNT(*) FROM Product WHERE barcode = ?", (barcode,)).fetchone()[0]
+        assert count == 1
+    api.product_cache.clear()
@@ -0,0 +1,27 @@
+import sqlite3
+
+import init_db
+from query_plans import CHECKS, check_query_plans, sample_db
+
+
+def test_api_queries_use_indexes():
+    conn = sample_db()
+    try:
+        assert check_query_plans(conn) == []
+    finally:
+        conn.close()
+
+
+def test_missing_table_is_reported_as_failure(tmp_path):
+    # Baza bez migracji z tabelami głosów - błąd zapytania zamiast wyjątku
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    init_db.create_schema(conn)
+    conn.close()
+    conn = sample_db(path)
+    try:
+        failures = check_query_plans(conn)
+    finally:
+        conn.close()
+    assert any("Category_votes" in failure for failure in failures)
+    assert len(failures) < len(CHECKS)
@@ -0,0 +1,302 @@
+import dataclasses
+import logging
+import os
+import threading
+from collections import Counter
+
+import orjson
+
+import db
+import metrics
+
+# Kategorie, które można zaproponować dla produktu (jak w aplikacji)
+RECYCLE_CATEGORIES = ("plastic", "plastic_bottles", "glass", "glass_bottles", "paper", "metal", "organic")
+
+# Dziennik głosów jeszcze niezapisanych w bazie - odtwarzany po restarcie
+VOTE_LOG_FILE = os.environ.get("VOTE_LOG_FILE", "votes.log")
+# Zapis do bazy co tyle sekund albo wcześniej, gdy czeka tyle głosów
+FLUSH_INTERVAL_S = float(os.environ.get("VOTE_FLUSH_INTERVAL", 1.0))
+FLUSH_MAX_PENDING = int(os.environ.get("VOTE_FLUSH_SIZE", 5000))
+# Ile głosów musi mieć kategoria, żeby została przypisana produktowi bez kategorii
+CATEGORY_MIN_VOTES = int(os.environ.get("CATEGORY_MIN_VOTES", 1))
+
+VERIFY_UPDATE = '''
+    UPDATE Product SET number_of_verifications = number_of_verifications + ? WHERE barcode = ?
+'''
+CATEGORY_TYPE_INSERT = "INSERT INTO Types_recycle (type_name) VALUES (?) ON CONFLICT(type_name) DO NOTHING"
+CATEGORY_VOTE_UPSERT = '''
+    INSERT INTO Category_votes (product_id, type_recycle_id, votes)
+    SELECT P.id, TR.type_recycle_id, ? FROM Product P, Types_recycle TR
+    WHERE P.barcode = ? AND TR.type_name = ?
+    ON CONFLICT(product_id, type_recycle_id) DO UPDATE SET votes = votes + excluded.votes
+'''
+# Produkt bez kategorii dostaje kategorię z największą liczbą głosów (co najmniej CATEGORY_MIN_VOTES)
+CATEGORY_ASSIGN = '''
+    UPDATE Product SET type_recycle_id = (
+        SELECT CV.type_recycle_id FROM Category_votes CV
+        WHERE CV.product_id = Product.id AND CV.votes >= ?
+        ORDER BY CV.votes DESC, CV.type_recycle_id LIMIT 1
+    )
+    WHERE barcode = ? AND type_recycle_id IS NULL
+'''
+APPLIED_SEQ_SELECT = "SELECT applied_seq FROM Vote_log WHERE id = 1"
+APPLIED_SEQ_UPDATE = '''
+    INSERT INTO Vote_log (id, applied_seq) VALUES (1, ?)
+    ON CONFLICT(id) DO UPDATE SET applied_seq = excluded.applied_seq
+'''
+
+
+class _Votes:
+    """ Zsumowane głosy dla jednego kodu: weryfikacje, propozycje kategorii, numer ostatniego głosu """
+
+    __slots__ = ("verifications", "categories", "seq")
+
+    def __init__(self):
+        self.verifications = 0
+        self.categories = Counter()
+        self.seq = 0
+
+    def merge(self, other):
+        self.verifications += other.verifications
+        self.categories.update(other.categories)
+        self.seq = max(self.seq, other.seq)
+
+
+class VoteQueue:
+    """
+    Głosy społeczności (weryfikacje produktu i propozycje kategorii)
+    zbierane w pamięci i zapisywane do bazy jedną transakcją co
+    interval sekund albo po max_pending głosach, zamiast UPDATE i commitu
+    na każde zapytanie.
+
+    Każdy głos jest najpierw dopisywany do dziennika log_file z kolejnym
+    numerem. Transakcja zapisu zapamiętuje w Vote_log numer ostatniego
+    zapisanego głosu, więc po restarcie odtwarzane są tylko głosy, których
+    nie ma jeszcze w bazie - także gdy proces padł między commitem a
+    przycięciem dziennika. Dziennik jest opróżniany do bufora systemu po
+    każdym głosie (bez fsync, jak synchronous=NORMAL w db.py).
+
+    on_flush(kody) wywoływane jest po zapisie partii, np. żeby unieważnić
+    cache produktów.
+    """
+
+    def __init__(self, log_file=VOTE_LOG_FILE, interval=FLUSH_INTERVAL_S, max_pending=FLUSH_MAX_PENDING,
+                 min_votes=CATEGORY_MIN_VOTES, on_flush=None):
+        self.log_file = log_file
+        self.interval = interval
+        self.max_pending = max_pending
+        self.min_votes = min_votes
+        self.on_flush = on_flush
+        self._pending = {}   # kod -> _Votes, jeszcze nie w transakcji
+        self._flushing = {}  # kod -> _Votes, w trwającej transakcji
+        self._count = 0
+        self._seq = 0
+        self._log = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.replayed = 0
+        self.flushes = 0
+        self.flushed = 0
+
+    @property
+    def started(self):
+        return self._log is not None
+
+    def start(self):
+        """ Odtwarza niezapisane głosy z dziennika i uruchamia wątek zapisu (raz) """
+        with self._flush_lock, self._lock:
+            if self._log is not None:
+                return
+            row = db.get_connection().execute(APPLIED_SEQ_SELECT).fetchone()
+            self._seq = row[0] if row else 0
+            self._replay()
+            # Przepisanie dziennika usuwa zapisane już głosy i ewentualną uciętą ostatnią linię
+            self._rewrite_log()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="vote-flusher", daemon=True)
+            self._thread.start()
+        if self.replayed:
+            logging.info(f"Odtworzono {self.replayed} niezapisanych głosów z {self.log_file}")
+
+    def stop(self, timeout=None):
+        """ Zatrzymuje wątek i zapisuje pozostałe głosy """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self.flush()
+        with self._lock:
+            self._log.close()
+            self._log = None
+
+    def verify(self, barcode):
+        self._record(barcode, None)
+
+    def suggest_category(self, barcode, category):
+        if category not in RECYCLE_CATEGORIES:
+            raise ValueError(f"Nieznana kategoria: {category}")
+        self._record(barcode, category)
+
+    def _record(self, barcode, category):
+        if self._log is None:
+            self.start()
+        with self._lock:
+            self._seq += 1
+            self._log.write(orjson.dumps([self._seq, barcode, category, 1]) + b"\n")
+            self._log.flush()
+            self._add(barcode, category, 1, self._seq)
+            if self._count >= self.max_pending:
+                self._wake.set()
+
+    def _add(self, barcode, category, count, seq):
+        votes = self._pending.get(barcode)
+        if votes is None:
+            votes = self._pending[barcode] = _Votes()
+        if category is None:
+            votes.verifications += count
+        else:
+            votes.categories[category] += count
+        votes.seq = max(votes.seq, seq)
+        self._count += count
+
+    def apply(self, product):
+        """ Produkt (z bazy albo cache) z doliczonymi głosami, które nie trafiły jeszcze do bazy """
+        if product is None or not (self._pending or self._flushing):
+            return product
+        verifications = 0
+        categories = Counter()
+        with self._lock:
+            for votes in (self._pending.get(product.barcode), self._flushing.get(product.barcode)):
+                if votes is not None:
+                    verifications += votes.verifications
+                    categories.update(votes.categories)
+        if not verifications and not categories:
+            return product
+
+        changes = {"number_of_verifications": product.number_of_verifications + verifications}
+        if product.recycle_type is None:
+            leading = categories.most_common(1)
+            if leading and leading[0][1] >= self.min_votes:
+                changes["recycle_type"] = leading[0][0]
+        return dataclasses.replace(product, **changes)
+
+    def flush(self):
+        """ Zapisuje oczekujące głosy jedną transakcją; zwraca liczbę zapisanych głosów """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                count, self._count = self._count, 0
+                applied_seq = self._seq
+                self._flushing = batch
+            conn = db.get_connection()
+            with metrics.span("votes_flush"):
+                try:
+                    self._write(conn, batch, applied_seq)
+                except BaseException:
+                    conn.rollback()
+                    with self._lock:
+                        self._requeue(batch, count)
+                    raise
+                # COMMIT, unieważnienie cache i zdjęcie głosów z nakładki pod jedną
+                # blokadą - apply() widzi albo wiersz sprzed zapisu z głosami w
+                # nakładce, albo zapisany wiersz bez nich, nigdy oba naraz. Odczyt
+                # sprzed unieważnienia nie zapisze starego wiersza do cache
+                # (generacja LRUCache) i przeczyta produkt ponownie (api.cache_product)
+                with self._lock:
+                    try:
+                        conn.commit()
+                    except BaseException:
+                        conn.rollback()
+                        self._requeue(batch, count)
+                        raise
+                    if self.on_flush is not None:
+                        self.on_flush(list(batch))
+                    self._flushing = {}
+                    self._rewrite_log()
+            self.flushes += 1
+            self.flushed += count
+            return count
+
+    def _requeue(self, batch, count):
+        # Głosy z nieudanego zapisu wracają do kolejki - dziennik nadal je ma
+        for barcode, votes in batch.items():
+            if barcode in self._pending:
+                votes.merge(self._pending[barcode])
+            self._pending[barcode] = votes
+        self._count += count
+        self._flushing = {}
+
+    def _write(self, conn, batch, applied_seq):
+        # Zapytania partii bez COMMIT - zatwierdza flush
+        verifications = [(votes.verifications, barcode) for barcode, votes in batch.items() if votes.verifications]
+        category_votes = [
+            (count, barcode, category)
+            for barcode, votes in batch.items() for category, count in votes.categories.items()
+        ]
+        conn.executemany(VERIFY_UPDATE, verifications)
+        if category_votes:
+            conn.executemany(CATEGORY_TYPE_INSERT, [(c,) for c in {c for _, _, c in category_votes}])
+            conn.executemany(CATEGORY_VOTE_UPSERT, category_votes)
+            conn.executemany(
+                CATEGORY_ASSIGN,
+                [(self.min_votes, barcode) for barcode, votes in batch.items() if votes.categories],
+            )
+        conn.execute(APPLIED_SEQ_UPDATE, (applied_seq,))
+
+    def _replay(self):
+        try:
+            f = open(self.log_file, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    seq, barcode, category, count = orjson.loads(line)
+                except ValueError:
+                    # Ucięta linia po awarii w trakcie zapisu
+                    logging.warning(f"Pominięto uszkodzony wpis dziennika głosów: {line!r}")
+                    continue
+                if seq <= self._seq:
+                    continue
+                self._add(barcode, category, count, seq)
+                self.replayed += count
+        self._seq = max([self._seq] + [votes.seq for votes in self._pending.values()])
+
+    def _rewrite_log(self):
+        # Dziennik po zapisie partii: tylko głosy, które czekają dalej (zsumowane po kodzie)
+        tmp_path = f"{self.log_file}.tmp"
+        with open(tmp_path, "wb") as f:
+            for barcode, votes in self._pending.items():
+                if votes.verifications:
+                    f.write(orjson.dumps([votes.seq, barcode, None, votes.verifications]) + b"\n")
+                for category, count in votes.categories.items():
+                    f.write(orjson.dumps([votes.seq, barcode, category, count]) + b"\n")
+        if self._log is not None:
+            self._log.close()
+        os.replace(tmp_path, self.log_file)
+        self._log = open(self.log_file, "ab")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Głosy zostają w pamięci i w dzienniku - kolejna próba przy następnym zapisie
+                logging.error(f"Nie udało się zapisać głosów: {e}")
+
+    def stats(self):
+        return {
+            "pending": self._count,
+            "replayed": self.replayed,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+        }